@@ -0,0 +1,71 @@
+"""
+Time to split multi-MB command output into Embed sized pieces: the old
+partition, which re-sliced the remaining text on every step, against the
+index based partition and the boundary aware chunks generator.
+
+    python benchmarks/bench_chunking.py [-s 1 4 16] [-r 3]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quantumutils as utils
+
+
+def old_partition(text, length):
+    """partition as it was, copying the rest of the text each time"""
+    res = []
+    while len(text) > 0:
+        res.append(text[:length])
+        text = text[length:]
+    return res
+
+
+def sample(megabytes, seed=0):
+    """traceback-like output: lines of varied length with the odd code block"""
+    rng = random.Random(seed)
+    lines = []
+    size = 0
+    while size < megabytes * 2 ** 20:
+        if rng.random() < 0.01:
+            line = '```py'
+        else:
+            line = '  File "main.py", line {}, in f{}'.format(rng.randrange(10 ** 4), 'x' * rng.randrange(120))
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines)
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, len(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--sizes', type=int, nargs='+', default=[1, 4, 16], help='megabytes of output')
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    opts = parser.parse_args()
+
+    length = utils.description_limit
+    print(f'{"MB":>4} {"method":>14} {"ms":>10} {"pieces":>8}')
+    for size in opts.sizes:
+        text = sample(size)
+        for name, func in (('old partition', lambda: old_partition(text, length)),
+                           ('partition', lambda: utils.partition(text, length)),
+                           ('chunks', lambda: list(utils.chunks(text))),
+                           ('chunks fenced', lambda: list(utils.chunks(text, fence='py')))):
+            best, pieces = timed(func, opts.repeat)
+            print(f'{size:>4} {name:>14} {best * 1000:>10.2f} {pieces:>8}')
+
+
+if __name__ == '__main__':
+    main()
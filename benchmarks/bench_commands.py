@@ -0,0 +1,116 @@
+"""
+Offline latency and throughput of the Media and Pystuff commands.
+
+Every HTTP call is answered by the replay StubServer, so runs are
+reproducible and need no internet access. Upstream rate limits are lifted
+for the run; caches are cleared before every call unless --warm is given.
+
+    python benchmarks/bench_commands.py [-n 200] [-c 10] [--latency 0.05]
+        [--jitter 0.02] [--errors 0.0] [--warm] [command ...]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import replay
+from fakes import FakeContext, load_bot
+
+scenarios = {
+    'youtube': ('Media', (), {'youtube': 'python'}),
+    'google': ('Media', (), {'query': 'python'}),
+    'wikipedia': ('Media', (), {'anything': 'Python (programming language)'}),
+    'xkcd': ('Media', (614,), {}),
+    'weather': ('Media', (), {'location': 'London'}),
+    'dictionary': ('Media', ('python',), {}),
+    'qrcode': ('Media', (), {'message': 'hello world'}),
+    'pypi': ('Pystuff', ('discord.py',), {}),
+    'pypisearch': ('Pystuff', ('discord',), {}),
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def clear_caches(module):
+    import pypiparser
+    import wikipages
+    pypiparser.cache.clear()
+    wikipages.cache.clear()
+    module.bot.xkcd.comics.clear()
+    for upstream in module.upstreams.values():
+        upstream.cache.clear()
+
+
+async def bench(module, name, number, concurrency, warm):
+    cog_name, args, kwargs = scenarios[name]
+    cog = getattr(module, cog_name)()
+    command = getattr(type(cog), name)
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(number):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            if not warm:
+                clear_caches(module)
+            ctx = FakeContext(module.bot)
+            start = time.perf_counter()
+            try:
+                await command.callback(cog, ctx, *args, **kwargs)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {'name': name, 'calls': number, 'errors': errors, 'throughput': number / elapsed,
+            'p50': percentile(latencies, 50) * 1000, 'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('commands', nargs='*', default=list(scenarios))
+    parser.add_argument('-n', '--number', type=int, default=200)
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--errors', type=float, default=0.0)
+    parser.add_argument('--warm', action='store_true')
+    opts = parser.parse_args()
+
+    server = replay.StubServer(opts.latency, opts.jitter, opts.errors, seed=0).start()
+    undo = replay.redirect(server)
+    module = load_bot()
+    from upstream import TokenBucket
+    for upstream in module.upstreams.values():
+        upstream.bucket = TokenBucket(1e9, 10 ** 9)
+        upstream.inflight = opts.concurrency
+
+    loop = asyncio.get_event_loop()
+    print(f'{"command":>12} {"calls":>6} {"errors":>6} {"req/s":>9} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    try:
+        for name in opts.commands:
+            r = loop.run_until_complete(bench(module, name, opts.number, opts.concurrency, opts.warm))
+            print(f'{r["name"]:>12} {r["calls"]:>6} {r["errors"]:>6} {r["throughput"]:>9.1f} '
+                  f'{r["p50"]:>9.2f} {r["p95"]:>9.2f} {r["p99"]:>9.2f}')
+    finally:
+        undo()
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
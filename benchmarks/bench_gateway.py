@@ -0,0 +1,260 @@
+"""
+End-to-end load on the dispatch path: synthetic gateway events go through
+on_message, getprefix, process_commands, the command and ctx.send, with every
+HTTP request answered locally (see gateway.py). Chatter, commands in the
+given mix and paginator reactions are spread over the guilds, reactions
+being timed until the reaction router has handed them to their paginator,
+and the run reports throughput, handling and reply latency by kind and command, and a
+timeline of the rate, memory and live tasks.
+
+It needs the libraries in requirements.txt, the modules missing from this
+tree are stubbed by fakes.load_bot.
+
+    python benchmarks/bench_gateway.py [-n 20000] [-g 200] [--chatter 0.7]
+        [--reactions 0.05] [--mix ping=3,emojify=2,help=1] [-c 200] [--rate 0]
+        [--custom 0.2] [--shards 1] [--latency 0] [--interval 1]
+"""
+import argparse
+import asyncio
+import collections
+import os
+import random
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gateway
+from fakes import FakeDB, load_bot
+from reactionrouter import get_reaction_router
+
+arguments = {'ping': '', 'say': ' hello there', 'emojify': ' load test 123!', 'collatz': ' 27',
+             'morse': ' m|sos we are sinking', 'perms': '', 'roleperms': '', 'dice': ' 3', 'factorial': ' 20',
+             'help': ''}
+default_mix = 'ping=3,emojify=2,collatz=2,dice=2,morse=1,perms=1,roleperms=1,help=1'
+chatter = ['hello everyone', 'anyone around?', 'lol', 'that match last night was something else',
+           'can someone help me with my code', 'brb', 'good morning', 'what is everyone playing']
+controls = ['▶', '◀', '⏭', '⏮']
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def rss():
+    """
+    :return: the resident set size in MB, the peak where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+class Load:
+    '''
+    generates the events and times them, from injection until the bot's handler returns and until its first reply
+    '''
+
+    def __init__(self, module, gate, opts):
+        self.bot = module.bot
+        self.gateway = gate
+        self.opts = opts
+        self.random = random.Random(opts.seed)
+        self.prefixes = module.info["bot"]["prefixes"]
+        self.mix = parse_mix(opts.mix)
+        self.paginators = module.paginators
+        self.router = get_reaction_router(self.bot)
+        self.pending = {}
+        self.awaiting_reply = {}
+        self.handled = collections.defaultdict(list)
+        self.replies = collections.defaultdict(list)
+        self.errors = 0
+        self.done = 0
+        self.sent = collections.deque(maxlen=500)
+        self.slots = asyncio.Semaphore(opts.concurrency)
+        self.timeline = []
+        gate.fake.on_send = self.on_send
+        self.wrap('on_message', lambda message: message.id)
+        self.wrap_router()
+
+    def wrap(self, name, event_of):
+        handler = getattr(self.bot, name)
+
+        async def timed(*args):
+            id = event_of(*args)
+            try:
+                await handler(*args)
+            except Exception:
+                if id in self.pending:
+                    self.errors += 1
+                raise
+            finally:
+                self.finish(id)
+        setattr(self.bot, name, timed)
+
+    def wrap_router(self):
+        """
+        times reactions on the router's reaction_add listener, the path a click takes to its paginator
+        """
+        dispatch = self.router.dispatch
+
+        async def timed(reaction, user):
+            id = gateway.event.get()
+            try:
+                await dispatch(reaction, user)
+            except Exception:
+                if id in self.pending:
+                    self.errors += 1
+                raise
+            finally:
+                self.finish(id)
+        self.bot.remove_listener(dispatch, 'on_reaction_add')
+        self.bot.add_listener(timed, 'on_reaction_add')
+
+    def finish(self, id):
+        entry = self.pending.pop(id, None)
+        if entry is None:
+            # the gateway echoing one of the bot's own messages
+            return
+        kind, start = entry
+        self.handled[kind].append(time.perf_counter() - start)
+        self.done += 1
+        self.slots.release()
+
+    def on_send(self, data, id):
+        entry = self.awaiting_reply.pop(id, None)
+        if entry is not None:
+            kind, start, guild, author = entry
+            self.replies[kind].append(time.perf_counter() - start)
+            if data['embeds']:
+                self.sent.append((guild, int(data['channel_id']), int(data['id']), author))
+
+    def inject(self):
+        roll = self.random.random()
+        # only reactions on cached messages reach reaction_add and the router, as on a live gateway
+        cached = {message.id for message in self.bot._connection._messages} if roll < self.opts.reactions else ()
+        sent = [entry for entry in self.sent if entry[2] in cached]
+        if sent:
+            # clicks go to open paginators where there are any, like real users' would
+            live = [entry for entry in sent if entry[2] in self.router.sessions] or sent
+            guild, channel, message, author = self.random.choice(live)
+            start = time.perf_counter()
+            id = self.gateway.reaction(guild, channel, message, author, self.random.choice(controls))
+            self.pending[id] = ('reaction', start)
+            return
+        guild = self.random.choice(self.gateway.guilds)
+        channel = self.random.choice(guild.channels)
+        author = self.random.choice(guild.users)
+        if roll < self.opts.reactions + self.opts.chatter:
+            kind, content = 'chatter', self.random.choice(chatter)
+        else:
+            kind = self.random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            prefix = guild.prefix if guild.prefix and self.random.random() < 0.5 else self.random.choice(self.prefixes)
+            content = prefix + kind + arguments.get(kind, '')
+        start = time.perf_counter()
+        # dispatching only schedules the handlers, so nothing has finished before the event is registered
+        id = self.gateway.message(guild, channel, author, content)
+        self.pending[id] = (kind, start)
+        self.awaiting_reply[id] = (kind, start, guild, int(author['id']))
+
+    def sample(self, start):
+        self.timeline.append((time.perf_counter() - start, self.done, rss(), len(asyncio.all_tasks()),
+                              self.paginators.stats()['sessions']))
+
+    async def sampler(self, start):
+        while True:
+            await asyncio.sleep(self.opts.interval)
+            self.sample(start)
+
+    async def run(self):
+        start = time.perf_counter()
+        sampler = asyncio.ensure_future(self.sampler(start))
+        gap = 1 / self.opts.rate if self.opts.rate else 0
+        for n in range(self.opts.number):
+            await self.slots.acquire()
+            self.inject()
+            if gap:
+                await asyncio.sleep(max(0, start + (n + 1) * gap - time.perf_counter()))
+            elif n % 64 == 0:
+                # let the dispatched handlers run, like between gateway frames
+                await asyncio.sleep(0)
+        while self.pending:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        sampler.cancel()
+        self.sample(start)
+        await self.paginators.close()
+        return elapsed
+
+
+def report(load, elapsed, opts):
+    print(f'{opts.number} events over {len(load.gateway.guilds)} guilds in {elapsed:.2f}s: '
+          f'{opts.number / elapsed:,.0f} events/s, {load.errors} handler errors')
+
+    print(f'\n{"handled":>10} {"events":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9} {"max ms":>9}')
+    for kind, values in sorted(load.handled.items(), key=lambda item: -len(item[1])):
+        values.sort()
+        print(f'{kind:>10} {len(values):>7} {percentile(values, 50) * 1000:>9.2f} '
+              f'{percentile(values, 95) * 1000:>9.2f} {percentile(values, 99) * 1000:>9.2f} {values[-1] * 1000:>9.2f}')
+
+    print(f'\n{"first reply":>11} {"replies":>7} {"p50 ms":>9} {"p95 ms":>9} {"p99 ms":>9}')
+    for kind, values in sorted(load.replies.items()):
+        values.sort()
+        print(f'{kind:>11} {len(values):>7} {percentile(values, 50) * 1000:>9.2f} '
+              f'{percentile(values, 95) * 1000:>9.2f} {percentile(values, 99) * 1000:>9.2f}')
+
+    print(f'\n{"t s":>6} {"handled":>8} {"events/s":>9} {"RSS MB":>8} {"tasks":>6} {"paginators":>10}')
+    last_at = last_done = 0
+    for at, done, memory, tasks, sessions in load.timeline:
+        rate = (done - last_done) / (at - last_at) if at > last_at else 0
+        print(f'{at:>6.1f} {done:>8} {rate:>9.0f} {memory:>8.1f} {tasks:>6} {sessions:>10}')
+        last_at, last_done = at, done
+
+    print('\nhttp requests: ' + ', '.join(f'{route} {n}' for route, n in sorted(load.gateway.fake.requests.items())))
+    print('reactions: ' + ', '.join(f'{k} {v}' for k, v in load.router.stats().items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=20000, help='events to send')
+    parser.add_argument('-g', '--guilds', type=int, default=200)
+    parser.add_argument('--channels', type=int, default=3, help='channels per guild')
+    parser.add_argument('--members', type=int, default=20, help='members per guild')
+    parser.add_argument('--shards', type=int, default=1)
+    parser.add_argument('--custom', type=float, default=0.2, help='fraction of guilds with a custom prefix')
+    parser.add_argument('--chatter', type=float, default=0.7, help='fraction of messages that are not commands')
+    parser.add_argument('--reactions', type=float, default=0.05, help='fraction of events that are reactions')
+    parser.add_argument('--mix', default=default_mix, help='command=weight,... for the command messages')
+    parser.add_argument('-c', '--concurrency', type=int, default=200, help='events being handled at once')
+    parser.add_argument('--rate', type=float, default=0, help='events per second, 0 for as fast as handled')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds each HTTP request takes')
+    parser.add_argument('--interval', type=float, default=1.0, help='seconds between timeline samples')
+    parser.add_argument('--seed', type=int, default=0)
+    opts = parser.parse_args()
+
+    fake = gateway.install_http(opts.latency)
+    module = load_bot()
+    module.bot.db = FakeDB()
+    module.add_cogs()
+    gate = gateway.Gateway(module.bot, fake, opts.guilds, opts.channels, opts.members, opts.shards, opts.custom,
+                           module.bot.db)
+    load = Load(module, gate, opts)
+    elapsed = module.bot.loop.run_until_complete(load.run())
+    report(load, elapsed, opts)
+
+
+if __name__ == '__main__':
+    main()
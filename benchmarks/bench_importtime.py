@@ -0,0 +1,75 @@
+"""
+Import-time profile of starting the bot, from python -X importtime: the
+wall time and peak memory of loading code.py as it is now, against loading
+it and then importing the libraries it defers to first use, which is what
+every start used to pay before the gateway connected. The slowest imports
+of the deferred run are listed.
+
+    python benchmarks/bench_importtime.py [-r 3] [-t 15]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+deferred = ['gtts', 'googletrans', 'urllib.request', 'motor.motor_asyncio', 'gspread',
+            'oauth2client.service_account']
+
+child = '''
+import importlib, resource, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {benchmarks!r})
+import fakes
+module = fakes.load_bot()
+for name in {eager!r}:
+    try:
+        module = importlib.import_module(name)
+        # lazy_import already put a lazy module there, which only runs once an attribute is read
+        getattr(module, '__name__')
+    except ImportError:
+        pass
+print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+'''
+
+
+def profile(eager):
+    code = child.format(benchmarks=os.path.join(root, 'benchmarks'), eager=deferred if eager else [])
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=root,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode:
+        raise SystemExit(proc.stderr[-2000:])
+    seconds, maxrss = proc.stdout.split()
+    imports = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        imports.append((int(cumulative), int(own), name.rstrip()))
+    return float(seconds), int(maxrss), imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-r', '--repeat', type=int, default=3)
+    parser.add_argument('-t', '--top', type=int, default=15)
+    opts = parser.parse_args()
+
+    print(f'{"startup":>9} {"best ms":>9} {"imports":>8} {"peak RSS MB":>12}')
+    for label, eager in (('deferred', False), ('eager', True)):
+        runs = [profile(eager) for _ in range(opts.repeat)]
+        seconds, maxrss, imports = min(runs, key=lambda run: run[0])
+        # ru_maxrss is in kilobytes on Linux
+        print(f'{label:>9} {seconds * 1000:>9.1f} {len(imports):>8} {maxrss / 1024:>12.1f}')
+        if not eager:
+            top = sorted((i for i in imports if not i[2].startswith('   ')), reverse=True)[:opts.top]
+
+    print('\nslowest top level imports while deferred')
+    print(f'{"cumulative ms":>14} {"self ms":>8}  module')
+    for cumulative, own, name in top:
+        print(f'{cumulative / 1000:>14.1f} {own / 1000:>8.1f}  {name.strip()}')
+
+
+if __name__ == '__main__':
+    main()
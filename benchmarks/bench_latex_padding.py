@@ -0,0 +1,117 @@
+"""
+Renders/sec of LaTeX padding under concurrent tex load: the old IO thread
+executor working on BytesIO objects against the process pool working on
+bytes. Also reports the worst event loop lag seen while each ran, which is
+what the commands sharing the loop actually feel.
+
+    python benchmarks/bench_latex_padding.py [-n 400] [-c 32]
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PIL.Image
+import PIL.ImageDraw
+
+from fakes import stub_missing
+
+# latex.py imports neko2, which is not in this tree
+stub_missing()
+import latex
+
+bg = (0x36, 0x39, 0x3E)
+
+
+def sample(width=900, height=120, opaque=False):
+    """a wide formula-like image: mostly transparent with white glyph strokes"""
+    img = PIL.Image.new('RGB' if opaque else 'RGBA', (width, height), (0, 0, 0) if opaque else (0, 0, 0, 0))
+    draw = PIL.ImageDraw.Draw(img)
+    for x in range(10, width - 20, 23):
+        draw.rectangle((x, 30 + x % 40, x + 12, 80 + x % 30), fill=(255, 255, 255) if opaque else (255, 255, 255, 255))
+    with io.BytesIO() as fp:
+        img.save(fp, 'PNG')
+        return fp.getvalue()
+
+
+def thread_pad(in_img: io.BytesIO, out_img: io.BytesIO, bg_colour):
+    """the padding as it ran before, on BytesIO objects in a thread"""
+    old_img = PIL.Image.open(in_img)
+    new_w = max(int(old_img.width * latex.padding_pct_width), latex.padding_min_width)
+    new_h = int(old_img.height * latex.padding_pct_height)
+    new_x = int((new_w - old_img.width) / 2)
+    new_y = int((new_h - old_img.height) / 2)
+    new_img = PIL.Image.new('RGBA', (new_w, new_h), (0, 0, 0, 0))
+    new_img.paste(old_img, (new_x, new_y))
+    non_transparent = PIL.Image.new('RGBA', (new_w, new_h), bg_colour)
+    PIL.Image.alpha_composite(non_transparent, new_img).save(out_img, 'PNG')
+
+
+async def run_thread(executor, data):
+    loop = asyncio.get_event_loop()
+    with io.BytesIO(data) as in_data, io.BytesIO() as out_data:
+        await loop.run_in_executor(executor, thread_pad, in_data, out_data, bg)
+        return out_data.getvalue()
+
+
+async def run_process(executor, data):
+    return await asyncio.get_event_loop().run_in_executor(executor, latex.pad_png, data, bg)
+
+
+async def load(runner, executor, data, number, concurrency):
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(0.005)
+            lag = max(lag, time.perf_counter() - start - 0.005)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await runner(executor, data)
+
+    tick = asyncio.ensure_future(ticker())
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(number)))
+    elapsed = time.perf_counter() - start
+    done = True
+    await tick
+    return number / elapsed, lag * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--number', type=int, default=400)
+    parser.add_argument('-c', '--concurrency', type=int, default=32)
+    opts = parser.parse_args()
+
+    loop = asyncio.get_event_loop()
+    workers = os.cpu_count() or 1
+    threads = concurrent.futures.ThreadPoolExecutor(max_workers=workers)
+    processes = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+    # Warm the pool up so process start-up is not counted.
+    loop.run_until_complete(run_process(processes, sample(100, 20)))
+
+    print(f'{workers} workers, {opts.number} renders, {opts.concurrency} concurrent')
+    print(f'{"image":>12} {"executor":>9} {"renders/s":>10} {"max lag ms":>11}')
+    for label, data in (('transparent', sample()), ('opaque', sample(opaque=True))):
+        for name, runner, executor in (('thread', run_thread, threads), ('process', run_process, processes)):
+            rate, lag = loop.run_until_complete(load(runner, executor, data, opts.number, opts.concurrency))
+            print(f'{label:>12} {name:>9} {rate:>10.1f} {lag:>11.2f}')
+
+    threads.shutdown()
+    processes.shutdown()
+
+
+if __name__ == '__main__':
+    main()
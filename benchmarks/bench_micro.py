@@ -0,0 +1,242 @@
+"""
+Micro-benchmarks of the pure helpers and the cores of the cheap commands, on
+a typical input and a worst case each. The best and median times per call
+are compared against the stored baselines, and a benchmark is flagged only
+when both are slower by more than the threshold, as either alone can move
+that much between two runs on the same machine. Any flag makes the exit
+status 1. --save records the current run as the new baselines, for this
+machine and Python.
+
+The modules missing from this tree are stubbed (see fakes.stub_missing), so
+every benchmark runs once requirements.txt is installed; any that still can't
+be set up is skipped, with the reason.
+
+    python benchmarks/bench_micro.py [-k collatz] [-r 7] [--min-time 0.2]
+        [--threshold 0.2] [--save] [--baselines benchmarks/baselines.json]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [here, os.path.dirname(here)]
+
+benchmarks = {}
+
+sentence = 'The quick brown fox jumps over the lazy dog, then naps: 42 times in 7 days! '
+
+
+def words(n):
+    """
+    :return: n characters of prose with a line break every few sentences
+    """
+    line = sentence * 3 + '\n'
+    return (line * (n // len(line) + 1))[:n]
+
+
+def benchmark(name, **inputs):
+    """
+    registers setup once per input, setup takes the input's arguments and returns the function to time
+    """
+    def register(setup):
+        for label, args in inputs.items():
+            benchmarks['{}[{}]'.format(name, label)] = functools.partial(setup, *args)
+        return setup
+    return register
+
+
+@functools.lru_cache()
+def bot_module():
+    """
+    :return: code.py loaded once, or why it couldn't be, so every command benchmark isn't retrying it
+    """
+    from fakes import load_bot
+    try:
+        return load_bot()
+    except Exception as e:
+        return e
+
+
+def command(cog, name, *args, **kwargs):
+    """
+    :return: a coroutine function calling the command's callback with a fake context
+    """
+    from fakes import FakeContext
+    module = bot_module()
+    if isinstance(module, Exception):
+        raise module
+    instance = getattr(module, cog)()
+    callback = getattr(type(instance), name).callback
+    ctx = FakeContext(module.bot)
+
+    async def call():
+        await callback(instance, ctx, *args, **kwargs)
+        ctx.sent.clear()
+    return call
+
+
+@benchmark('partition', typical=(5000, 2000), worst=(2 ** 18, 1))
+def partition(size, length):
+    import quantumutils
+    text = words(size)
+    return lambda: quantumutils.partition(text, length)
+
+
+@benchmark('chunks', typical=(5000, None), worst=(2 ** 20, 'py'))
+def chunks(size, fence):
+    import quantumutils
+    text = words(size)
+    return lambda: list(quantumutils.chunks(text, fence=fence))
+
+
+@benchmark('find', typical=('fox', words(10000)), worst=('aa', 'a' * 2 ** 18))
+def find(substring, string):
+    import quantumutils
+    return lambda: list(quantumutils.find(substring, string))
+
+
+@benchmark('generate_url', typical=(r'\frac{a}{b} + \sqrt{x^2 + y^2}',),
+           worst=(r'\sum_{i=0}^{n} \frac{\alpha_i}{\beta_i + \gamma} ' * 40,))
+def generate_url(content):
+    from fakes import stub_missing
+    stub_missing()
+    import latex
+    return lambda: latex.LatexCog.generate_url(content, size=12, bg_colour='transparent')
+
+
+# '!' has no morse code and would end the conversion at the first sentence
+@benchmark('morse encode', typical=('m|hello world',),
+           worst=('m|' + words(1998).replace('\n', ' ').replace('!', '.'),))
+def morse_encode(message):
+    return command('Fun', 'morse', message=message)
+
+
+@benchmark('morse decode', typical=('e|......-...-..---/.-----..--..',), worst=('e|' + '-.-./' * 399,))
+def morse_decode(message):
+    return command('Fun', 'morse', message=message)
+
+
+@benchmark('emojify', typical=('Hello world 123!',), worst=(words(2000),))
+def emojify(text):
+    return command('Fun', 'emojify', text=text)
+
+
+@benchmark('collatz', typical=(27,), worst=(2 ** 256 - 1,))
+def collatz(num):
+    return command('Math', 'collatz', num)
+
+
+@benchmark('perms', typical=())
+def perms():
+    return command('Information', 'perms')
+
+
+@benchmark('roleperms', typical=())
+def roleperms():
+    return command('Information', 'roleperms')
+
+
+def measure(func, number, loop):
+    """
+    :return: seconds taken by number calls of func, awaited in one go on loop if it is a coroutine function
+    """
+    if asyncio.iscoroutinefunction(func):
+        async def batch():
+            start = time.perf_counter()
+            for _ in range(number):
+                await func()
+            return time.perf_counter() - start
+        return loop.run_until_complete(batch())
+    start = time.perf_counter()
+    for _ in range(number):
+        func()
+    return time.perf_counter() - start
+
+
+def run(func, repeat, min_time, loop):
+    """
+    doubles the calls per round until a round takes min_time, then times repeat rounds
+    :return: (best, median) seconds per call and the calls per round
+    """
+    number = 1
+    while measure(func, number, loop) < min_time and number < 2 ** 24:
+        number *= 2
+    rounds = [measure(func, number, loop) / number for _ in range(repeat)]
+    return min(rounds), statistics.median(rounds), number
+
+
+def load_baselines(path):
+    try:
+        with open(path) as f:
+            return json.loads(f.read())
+    except FileNotFoundError:
+        return {'cases': {}}
+
+
+def environment():
+    return {'python': platform.python_version(), 'machine': platform.platform()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', '--keyword', action='append', help='only run benchmarks whose name contains this')
+    parser.add_argument('-r', '--repeat', type=int, default=7)
+    parser.add_argument('--min-time', type=float, default=0.2, help='seconds each round runs for at least')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown over the baseline that is flagged')
+    parser.add_argument('--save', action='store_true', help='store this run as the baselines')
+    parser.add_argument('--baselines', default=os.path.join(here, 'baselines.json'))
+    opts = parser.parse_args()
+
+    baselines = load_baselines(opts.baselines)
+    stored = {key: baselines.get(key) for key in environment()}
+    if baselines['cases'] and stored != environment():
+        print('baselines were recorded on {machine} with Python {python}, timings may not compare'.format(**stored))
+
+    loop = asyncio.get_event_loop()
+    regressions = []
+    results = {}
+    print(f'{"benchmark":<24} {"best us":>11} {"median us":>11} {"baseline us":>12} {"best":>8} {"median":>8}')
+    for name, setup in benchmarks.items():
+        if opts.keyword and not any(k in name for k in opts.keyword):
+            continue
+        try:
+            func = setup()
+        except Exception as e:
+            print(f'{name:<24} skipped, {type(e).__name__}: {e}')
+            continue
+        best, median, number = run(func, opts.repeat, opts.min_time, loop)
+        results[name] = {'best': best, 'median': median, 'number': number}
+        base = baselines['cases'].get(name)
+        if base is None:
+            print(f'{name:<24} {best * 1e6:>11.2f} {median * 1e6:>11.2f} {"-":>12}')
+            continue
+        change = best / base['best'] - 1
+        median_change = median / base['median'] - 1
+        flag = ''
+        if min(change, median_change) > opts.threshold:
+            flag = 'REGRESSED'
+            regressions.append(name)
+        elif max(change, median_change) < -opts.threshold:
+            flag = 'improved'
+        print(f'{name:<24} {best * 1e6:>11.2f} {median * 1e6:>11.2f} {base["best"] * 1e6:>12.2f} '
+              f'{change:>+8.1%} {median_change:>+8.1%} {flag}')
+
+    if opts.save:
+        baselines.update(environment())
+        baselines['cases'].update(results)
+        with open(opts.baselines, 'w') as f:
+            f.write(json.dumps(baselines, indent=2, sort_keys=True) + '\n')
+        print(f'\nsaved {len(results)} baselines to {opts.baselines}')
+    elif regressions:
+        print(f'\n{len(regressions)} regressed beyond {opts.threshold:.0%}: {", ".join(regressions)}')
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+"""
+Compares the old rescanning pypisearch extraction against the single pass
+parser on the saved search page in fixtures/.
+Run from the repository root: python benchmarks/bench_pypisearch.py
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import quantumutils as utils
+import pypiparser
+
+fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pypi_search.html')
+
+
+def legacy(f):
+    indicess = list(utils.find('<h3 class="package-snippet__title">', f))
+    indicese = list(utils.find('</h3>', f))
+    modules = []
+    for i in range(len(indicess)):
+        e = (f[indicess[i]:indicese[i]])
+        namestart = list(utils.find('<span class="package-snippet__name">', e))[0] + 36
+        verstart = list(utils.find('<span class="package-snippet__version">', e))[0] + 39
+        spans = list(utils.find('</span>', e))
+        modules.append(f"{e[namestart:spans[0]]}: v{e[verstart:spans[1]]}")
+    return modules
+
+
+def chunked(text, size=8192):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def streamed(f, limit):
+    return [f"{name}: v{version}" for name, version, _ in pypiparser.parse(chunked(f), limit)]
+
+
+def main(number=200):
+    with open(fixture, encoding='utf8') as fp:
+        page = fp.read()
+    assert legacy(page) == streamed(page, 20), 'parsers disagree'
+    cases = [('legacy find', lambda: legacy(page)),
+             ('parser, all results', lambda: streamed(page, 20)),
+             ('parser, first 5', lambda: streamed(page, 5))]
+    print(f'{len(page)} characters, {len(legacy(page))} results, {number} runs each')
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=number, repeat=5)) / number
+        print(f'{name:>22}: {best * 1e6:10.1f} us/page')
+
+
+if __name__ == '__main__':
+    main()
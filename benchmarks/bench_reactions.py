@@ -0,0 +1,118 @@
+"""
+Cost of one reaction_add event with thousands of open paginator sessions:
+discord.py's wait_for, which runs every waiter's check on every event, against
+the ReactionRouter's single lookup by message id.
+
+    python benchmarks/bench_reactions.py [-s 100 1000 5000] [-e 20000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reactionrouter import ReactionRouter
+
+controls = ['⏮', '◀', '⏹', '▶', '⏭', '🔢', '❌']
+bot_id = 1
+
+
+class Message:
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+class User:
+    __slots__ = ('id',)
+
+    def __init__(self, id):
+        self.id = id
+
+
+class Reaction:
+    __slots__ = ('message', 'emoji')
+
+    def __init__(self, message, emoji):
+        self.message = message
+        self.emoji = emoji
+
+    def __str__(self):
+        return self.emoji
+
+
+def wait_for_listeners(sessions):
+    """the listener list discord.py keeps for wait_for('reaction_add', check=...)"""
+    listeners = []
+    for message_id, author_id in sessions:
+        def check(r, u, message_id=message_id, author_id=author_id):
+            if str(r) not in controls:
+                return False
+            elif u.id == bot_id or r.message.id != message_id:
+                return False
+            elif u.id != author_id:
+                return False
+            return True
+        listeners.append((None, check))
+    return listeners
+
+
+def dispatch_wait_for(listeners, reaction, user):
+    """mirrors Client.dispatch: every check runs, matching waiters are removed"""
+    removed = []
+    for index, (future, condition) in enumerate(listeners):
+        if condition(reaction, user):
+            removed.append(index)
+    for index in reversed(removed):
+        # a real waiter re-registers straight after; keep the list the same size
+        listeners.append(listeners.pop(index))
+
+
+def events(sessions, number, seed=0):
+    rng = random.Random(seed)
+    for _ in range(number):
+        message_id, author_id = rng.choice(sessions)
+        user = author_id if rng.random() < 0.9 else rng.randrange(10 ** 6, 10 ** 7)
+        yield Reaction(Message(message_id), rng.choice(controls)), User(user)
+
+
+def bench(size, number):
+    sessions = [(10 ** 17 + i, 10 ** 5 + i) for i in range(size)]
+    stream = list(events(sessions, number))
+
+    listeners = wait_for_listeners(sessions)
+    start = time.perf_counter()
+    for reaction, user in stream:
+        dispatch_wait_for(listeners, reaction, user)
+    old = (time.perf_counter() - start) / number
+
+    router = ReactionRouter(bot_id)
+    for message_id, author_id in sessions:
+        router.register(message_id, users=[author_id], emojis=controls)
+    start = time.perf_counter()
+    for reaction, user in stream:
+        router.deliver(reaction.message.id, str(reaction), user.id, (reaction, user))
+    new = (time.perf_counter() - start) / number
+    return old, new, router.counters['delivered']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--sessions', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('-e', '--events', type=int, default=20000)
+    opts = parser.parse_args()
+
+    # deliver() queues onto asyncio.Queue, which wants a loop in scope
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    print(f'{"sessions":>9} {"wait_for us":>12} {"router us":>10} {"speedup":>8} {"delivered":>10}')
+    for size in opts.sessions:
+        old, new, delivered = bench(size, opts.events)
+        print(f'{size:>9} {old * 1e6:>12.2f} {new * 1e6:>10.2f} {old / new:>8.1f} {delivered:>10}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,236 @@
+"""
+Stand-ins for the discord objects a command touches, so command callbacks can
+be invoked without a gateway connection. Everything sent is recorded instead.
+"""
+import asyncio
+import importlib.util
+import itertools
+import os
+import sys
+import types
+
+import discord
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+from reactionrouter import ReactionRouter
+
+ids = itertools.count(10 ** 17)
+
+
+def stub_missing():
+    """
+    code.py imports paginator and dbwrapper, and latex.py imports neko2, none of which are in this tree.
+    Whichever of them can't be imported is replaced in sys.modules by a stand-in, their names are only used
+    by commands the benchmarks don't run
+    """
+    for name in ('paginator', 'dbwrapper'):
+        if name not in sys.modules and importlib.util.find_spec(name) is None:
+            sys.modules[name] = types.ModuleType(name)
+    if 'neko2' in sys.modules or importlib.util.find_spec('neko2') is not None:
+        return
+    from discord.ext import commands
+
+    class CogTraits:
+        pass
+
+    async def try_delete(ctx):
+        try:
+            await ctx.message.delete()
+        except discord.HTTPException:
+            pass
+
+    neko2 = types.ModuleType('neko2')
+    neko2.shared = types.ModuleType('neko2.shared')
+    neko2.shared.traits = types.ModuleType('neko2.shared.traits')
+    neko2.shared.traits.CogTraits = CogTraits
+    neko2.shared.commands = types.ModuleType('neko2.shared.commands')
+    neko2.shared.commands.command = commands.command
+    neko2.shared.commands.try_delete = try_delete
+    sys.modules.update({'neko2': neko2, 'neko2.shared': neko2.shared, 'neko2.shared.traits': neko2.shared.traits,
+                        'neko2.shared.commands': neko2.shared.commands})
+
+
+def load_bot():
+    """
+    imports code.py without starting the bot
+    :return: the module, its commands.Bot is module.bot
+    """
+    os.chdir(root)
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    stub_missing()
+    spec = importlib.util.spec_from_file_location('quantum', os.path.join(root, 'code.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FakeRole:
+    def __init__(self, name='@everyone', permissions=None):
+        self.id = next(ids)
+        self.name = name
+        self.permissions = discord.Permissions.general() if permissions is None else permissions
+
+
+class FakeUser:
+    def __init__(self, name='tester', id=None, bot=False):
+        self.id = next(ids) if id is None else id
+        self.name = name
+        self.bot = bot
+        self.colour = self.color = discord.Colour(0x3498db)
+        self.mention = f'<@{self.id}>'
+        self.avatar_url = 'https://cdn.discordapp.com/embed/avatars/0.png'
+        self.guild_permissions = discord.Permissions.all()
+        self.top_role = FakeRole()
+
+    def __str__(self):
+        return f'{self.name}#0001'
+
+    async def send(self, *args, **kwargs):
+        return FakeMessage(None, self, *args, **kwargs)
+
+
+class FakeGuild:
+    def __init__(self, name='guild', id=None):
+        self.id = next(ids) if id is None else id
+        self.name = name
+        self.members = []
+        self.roles = []
+
+    def get_member(self, id):
+        return discord.utils.get(self.members, id=id)
+
+
+class FakeChannel:
+    def __init__(self, guild, name='general', id=None):
+        self.id = next(ids) if id is None else id
+        self.guild = guild
+        self.name = name
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        msg = FakeMessage(self, None, content, **kwargs)
+        self.sent.append(msg)
+        return msg
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content=None, embed=None, file=None, delete_after=None, **kwargs):
+        self.id = next(ids)
+        self.channel = channel
+        self.guild = getattr(channel, 'guild', None)
+        self.author = author
+        self.content = content or ''
+        self.embed = embed
+        self.file = file
+        self.reactions = []
+        self.edits = 0
+
+    async def add_reaction(self, emoji):
+        self.reactions.append(str(emoji))
+
+    async def remove_reaction(self, emoji, member):
+        pass
+
+    async def clear_reactions(self):
+        self.reactions.clear()
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        self.edits += 1
+        self.content = content if content is not None else self.content
+        self.embed = embed if embed is not None else self.embed
+
+    async def delete(self):
+        pass
+
+
+class FakeDB:
+    '''an in-memory GuildDB, each collection a list of documents'''
+
+    def __init__(self, **collections):
+        self.collections = {name: list(docs) for name, docs in collections.items()}
+        self.collection = ""
+
+    async def add_collection(self, name):
+        self.collections.setdefault(name, [])
+        self.collection = name
+
+    def set_collection(self, name):
+        self.collection = name
+
+    async def insert(self, **kwargs):
+        self.collections.setdefault(self.collection, []).append(kwargs)
+
+    async def delete(self, **kwargs):
+        docs = self.collections.get(self.collection, [])
+        docs[:] = [doc for doc in docs if any(doc.get(k) != v for k, v in kwargs.items())]
+
+    async def find(self, length=1000, **kwargs):
+        docs = self.collections.get(self.collection, [])
+        return [dict(doc) for doc in docs if all(doc.get(k) == v for k, v in kwargs.items())][:length]
+
+
+class ClosedSession:
+    async def wait(self, timeout=None):
+        raise asyncio.TimeoutError
+
+
+class NoReactions(ReactionRouter):
+    '''a reaction router whose sessions time out straight away'''
+
+    def register(self, message_id, users=None, emojis=None):
+        return ClosedSession()
+
+
+class FakeBot:
+    '''
+    wraps the real bot, answering wait_for and reaction sessions immediately
+    with a timeout so interactive commands like the paginators finish on their own
+    '''
+
+    def __init__(self, bot):
+        self._bot = bot
+        self.reaction_router = NoReactions()
+
+    def __getattr__(self, name):
+        return getattr(self._bot, name)
+
+    @property
+    def loop(self):
+        return asyncio.get_event_loop()
+
+    async def wait_for(self, event, *, check=None, timeout=None):
+        raise asyncio.TimeoutError
+
+
+class Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+
+class FakeContext:
+    def __init__(self, bot, author=None, channel=None, content='', prefix='q!'):
+        self.bot = FakeBot(bot)
+        self.author = author or FakeUser()
+        self.channel = channel or FakeChannel(FakeGuild())
+        self.guild = self.channel.guild
+        self.message = FakeMessage(self.channel, self.author, content)
+        self.prefix = prefix
+        self.invoked_with = ''
+        self.command = None
+
+    @property
+    def sent(self):
+        return self.channel.sent
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+    def typing(self):
+        return Typing()
@@ -0,0 +1,184 @@
+"""
+A fake Discord for driving the real bot end to end without a connection.
+
+Gateway feeds MESSAGE_CREATE and MESSAGE_REACTION_ADD payloads straight into
+the bot's ConnectionState, so events take the same path a live gateway
+dispatch takes: on_message, getprefix, process_commands, the command and
+ctx.send. install_http() must run before code.py is loaded: it replaces
+HTTPClient.request with FakeHTTP, which answers every route locally and
+echoes the messages the bot sends back through the gateway, as Discord does.
+"""
+import asyncio
+import contextvars
+import datetime
+import itertools
+
+import discord
+from discord import http
+
+# the event being handled, tasks dispatched for it inherit it
+event = contextvars.ContextVar('event', default=None)
+
+epoch = discord.utils.time_snowflake(datetime.datetime(2018, 7, 1))
+timestamp = '2018-07-01T12:00:00.000000+00:00'
+
+
+class Snowflakes:
+    '''ids spread over time like real ones, so guilds land on every shard'''
+
+    def __init__(self):
+        self.counter = itertools.count(1)
+
+    def __next__(self):
+        return epoch + (next(self.counter) << 22)
+
+
+snowflakes = Snowflakes()
+
+
+def user_payload(id, name, bot=False):
+    return {'id': str(id), 'username': name, 'discriminator': '{:04}'.format(id % 10000), 'avatar': None,
+            'bot': bot}
+
+
+def member_payload(user):
+    return {'user': user, 'roles': [], 'joined_at': timestamp, 'deaf': False, 'mute': False}
+
+
+def guild_payload(id, name, owner, users, channels):
+    return {'id': str(id), 'name': name, 'owner_id': owner['id'], 'region': 'us-east', 'icon': None,
+            'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0,
+            'mfa_level': 0, 'features': [], 'emojis': [], 'presences': [], 'large': False,
+            'member_count': len(users), 'members': [member_payload(user) for user in users],
+            'roles': [{'id': str(id), 'name': '@everyone', 'permissions': 104324161, 'position': 0, 'color': 0,
+                       'hoist': False, 'managed': False, 'mentionable': False}],
+            'channels': [{'id': str(channel), 'type': 0, 'name': 'channel-{}'.format(n), 'position': n,
+                          'permission_overwrites': [], 'topic': None, 'nsfw': False}
+                         for n, channel in enumerate(channels)]}
+
+
+def message_payload(id, channel_id, guild_id, author, content='', embeds=()):
+    return {'id': str(id), 'channel_id': str(channel_id), 'guild_id': str(guild_id), 'author': author,
+            'member': member_payload(author), 'content': content, 'timestamp': timestamp,
+            'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+            'mention_roles': [], 'attachments': [], 'embeds': list(embeds), 'pinned': False, 'type': 0}
+
+
+class FakeGuild:
+    __slots__ = ('id', 'channels', 'users', 'prefix')
+
+    def __init__(self, id, channels, users, prefix=None):
+        self.id = id
+        self.channels = channels
+        self.users = users
+        self.prefix = prefix
+
+
+class FakeHTTP:
+    '''
+    answers the bot's HTTP requests without a network, keeping a count per route
+    :param latency: seconds every request takes, like Discord's round trip
+    '''
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.gateway = None
+        self.requests = {}
+        self.on_send = None
+
+    async def request(self, client, route, *, files=None, **kwargs):
+        key = '{} {}'.format(route.method, route.path)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if key == 'POST /channels/{channel_id}/messages':
+            return self.message(route, kwargs, next(snowflakes))
+        if key == 'PATCH /channels/{channel_id}/messages/{message_id}':
+            return self.message(route, kwargs, int(route.url.rsplit('/', 1)[1]))
+        return None
+
+    def message(self, route, kwargs, id):
+        payload = kwargs.get('json') or {}
+        embed = payload.get('embed')
+        channel_id = int(route.channel_id)
+        guild_id = self.gateway.channel_guilds.get(channel_id, 0)
+        data = message_payload(id, channel_id, guild_id, self.gateway.bot_user, payload.get('content') or '',
+                               [embed] if embed else [])
+        if route.method == 'POST':
+            if self.on_send is not None:
+                self.on_send(data, event.get())
+            # Discord sends every new message back over the gateway, the bot's own included
+            self.gateway.state.parse_message_create(data)
+        return data
+
+
+def install_http(latency=0.0):
+    """
+    routes every request made by any discord HTTPClient to a FakeHTTP
+    :return: the FakeHTTP
+    """
+    fake = FakeHTTP(latency)
+
+    async def request(client, route, *, files=None, **kwargs):
+        return await fake.request(client, route, files=files, **kwargs)
+    http.HTTPClient.request = request
+    return fake
+
+
+class Gateway:
+    '''
+    a gateway session for bot with guilds guilds, each with channels channels and members members
+    :param custom: fraction of the guilds given a custom prefix in the database
+    '''
+
+    def __init__(self, bot, fake, guilds=100, channels=3, members=20, shards=1, custom=0.0, db=None):
+        self.bot = bot
+        self.state = bot._connection
+        self.fake = fake
+        fake.gateway = self
+        self.bot_user = user_payload(next(snowflakes), 'Quantum Bot', bot=True)
+        self.state.user = discord.ClientUser(state=self.state, data=dict(self.bot_user, verified=True,
+                                                                         mfa_enabled=False))
+        self.state.shard_count = bot.shard_count = shards
+        self.guilds = []
+        self.channel_guilds = {}
+        # consecutive guild ids, so they spread evenly over the shards
+        ids = [next(snowflakes) for _ in range(guilds)]
+        for n, id in enumerate(ids):
+            users = [user_payload(next(snowflakes), 'user{}-{}'.format(n, m)) for m in range(members)]
+            guild = FakeGuild(id, [next(snowflakes) for _ in range(channels)], users,
+                              '!' if n < guilds * custom else None)
+            self.state._add_guild_from_data(guild_payload(guild.id, 'guild {}'.format(n), users[0], users,
+                                                          guild.channels))
+            if guild.prefix is not None and db is not None:
+                db.collections.setdefault('guilds', []).append({'id': guild.id, 'prefix': guild.prefix})
+            self.channel_guilds.update((channel, guild.id) for channel in guild.channels)
+            self.guilds.append(guild)
+
+    def message(self, guild, channel, author, content):
+        """
+        dispatches a MESSAGE_CREATE as a user
+        :return: the new message's id
+        """
+        id = next(snowflakes)
+        token = event.set(id)
+        try:
+            self.state.parse_message_create(message_payload(id, channel, guild.id, author, content))
+        finally:
+            event.reset(token)
+        return id
+
+    def reaction(self, guild, channel, message_id, user_id, emoji):
+        """
+        dispatches a MESSAGE_REACTION_ADD for a unicode emoji
+        :return: an id for the event, there is none in the payload
+        """
+        id = next(snowflakes)
+        token = event.set(id)
+        try:
+            self.state.parse_message_reaction_add({'user_id': str(user_id), 'channel_id': str(channel),
+                                                   'message_id': str(message_id), 'guild_id': str(guild.id),
+                                                   'emoji': {'id': None, 'name': emoji, 'animated': False}})
+        finally:
+            event.reset(token)
+        return id
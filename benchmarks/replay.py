@@ -0,0 +1,179 @@
+"""
+Record/replay HTTP harness for benchmarking the bot's commands offline.
+
+StubServer serves the captured responses listed in fixtures/http/index.json
+from a local aiohttp server running on its own thread, with optional added
+latency and injected errors. redirect() reroutes aiohttp, urllib and requests
+calls for the captured hosts to that server.
+
+Record a new fixture from the live service:
+    python benchmarks/replay.py record <url> <file name> [content type]
+"""
+import asyncio
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import urllib.parse
+import urllib.request
+
+import aiohttp
+from aiohttp import web
+
+here = os.path.dirname(os.path.abspath(__file__))
+fixtures = os.path.join(here, 'fixtures', 'http')
+
+
+def load_routes(path=fixtures):
+    with open(os.path.join(path, 'index.json')) as f:
+        routes = json.loads(f.read())
+    for route in routes:
+        with open(os.path.join(path, route['file']), 'rb') as f:
+            route['body'] = f.read()
+    return routes
+
+
+class StubServer:
+    '''
+    serves fixture responses for http://127.0.0.1:<port>/<host><path>
+    :param latency: seconds added to every response
+    :param jitter: maximum random seconds added on top of latency
+    :param error_rate: fraction of requests answered with error_status
+    '''
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, error_status=503, seed=None):
+        self.routes = load_routes()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.hits = {}
+        self.port = None
+        self.loop = None
+        self.runner = None
+        self.thread = None
+
+    def match(self, host, path, query):
+        for route in self.routes:
+            if route['host'] != host or not path.startswith(route['path']):
+                continue
+            if all(query.get(k) == v for k, v in route.get('query', {}).items()):
+                return route
+        return None
+
+    async def handle(self, request):
+        host, _, path = request.match_info['tail'].partition('/')
+        route = self.match(host, '/' + path, dict(request.query))
+        delay = self.latency + self.random.random() * self.jitter
+        if delay:
+            await asyncio.sleep(delay)
+        if route is None:
+            return web.Response(status=404, text='no fixture for ' + host + '/' + path)
+        self.hits[route['file']] = self.hits.get(route['file'], 0) + 1
+        if self.error_rate and self.random.random() < self.error_rate:
+            return web.Response(status=self.error_status, text='injected error')
+        return web.Response(status=route.get('status', 200), body=route['body'],
+                            content_type=route['content_type'], charset='utf-8')
+
+    def start(self):
+        started = threading.Event()
+
+        def serve():
+            self.loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self.loop)
+            app = web.Application()
+            app.router.add_route('*', '/{tail:.*}', self.handle)
+            self.runner = web.AppRunner(app)
+            self.loop.run_until_complete(self.runner.setup())
+            sock = socket.socket()
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+            self.loop.run_until_complete(web.SockSite(self.runner, sock).start())
+            started.set()
+            self.loop.run_forever()
+            self.loop.run_until_complete(self.runner.cleanup())
+            self.loop.close()
+
+        self.thread = threading.Thread(target=serve, name='stub-server', daemon=True)
+        self.thread.start()
+        started.wait()
+        return self
+
+    def stop(self):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+    def rewrite(self, url):
+        """
+        maps a live URL onto the stub server, leaving hosts without fixtures alone
+        """
+        parts = urllib.parse.urlsplit(str(url))
+        if not any(route['host'] == parts.hostname for route in self.routes):
+            return url
+        query = '?' + parts.query if parts.query else ''
+        return f'http://127.0.0.1:{self.port}/{parts.hostname}{parts.path}{query}'
+
+
+def redirect(server):
+    """
+    patches aiohttp, urllib and requests so captured hosts are answered by server
+    :return: a function undoing the patches
+    """
+    original_request = aiohttp.ClientSession._request
+    original_urlopen = urllib.request.urlopen
+
+    async def _request(self, method, url, *args, **kwargs):
+        return await original_request(self, method, server.rewrite(url), *args, **kwargs)
+
+    def urlopen(url, *args, **kwargs):
+        if isinstance(url, urllib.request.Request):
+            url.full_url = server.rewrite(url.full_url)
+            return original_urlopen(url, *args, **kwargs)
+        return original_urlopen(server.rewrite(url), *args, **kwargs)
+
+    aiohttp.ClientSession._request = _request
+    urllib.request.urlopen = urlopen
+    try:
+        import requests
+    except ImportError:
+        requests = None
+    else:
+        original_send = requests.Session.request
+
+        def request(self, method, url, *args, **kwargs):
+            return original_send(self, method, server.rewrite(url), *args, **kwargs)
+        requests.Session.request = request
+
+    def undo():
+        aiohttp.ClientSession._request = original_request
+        urllib.request.urlopen = original_urlopen
+        if requests is not None:
+            requests.Session.request = original_send
+    return undo
+
+
+async def record(url, name, content_type='application/json'):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(url) as response:
+            body = await response.read()
+            status = response.status
+    with open(os.path.join(fixtures, name), 'wb') as f:
+        f.write(body)
+    parts = urllib.parse.urlsplit(url)
+    with open(os.path.join(fixtures, 'index.json')) as f:
+        index = json.loads(f.read())
+    index.insert(0, {'host': parts.hostname, 'path': parts.path, 'file': name,
+                     'content_type': content_type, 'status': status})
+    with open(os.path.join(fixtures, 'index.json'), 'w') as f:
+        f.write(json.dumps(index, indent=2) + '\n')
+    print(f'saved {len(body)} bytes from {url} as {name} ({status})')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 4 or sys.argv[1] != 'record':
+        sys.exit(__doc__)
+    asyncio.get_event_loop().run_until_complete(record(*sys.argv[2:5]))
@@ -1,9 +1,6 @@
 #!/usr/bin/env python3.7
 # -*- coding: utf-8 -*-
-import gtts
-import gtts.lang
 from discord.ext import commands
-import urllib.request
 import urllib.parse
 import discord
 import math
@@ -11,34 +8,96 @@ import random
 import time
 import datetime
 import aiohttp
+import asyncio
 import functools
+import os
 import inspect
 import re
 import io
 import contextlib
 import traceback
-from googletrans import Translator
 import json
 
 from databasestuff import GuildDB
 from paginator import *
-from simplepaginator import SimplePaginator
+from simplepaginator import SimplePaginator, page, paginators
+from currency import RateTable
+from xkcdindex import XkcdIndex
+from wikipages import Article
+import pypiparser
+import upstream
+from upstream import upstreams, UpstreamUnavailable
+from editrouter import get_router, EditFilter
+from reactionrouter import get_reaction_router
+from helpindex import get_help_index
+from commandlog import CommandLog
+from metrics import Metrics
+from loopwatch import LagMonitor
+from scheduler import Scheduler
+from sharedstate import SharedState, shared_cooldown
 import quantumutils as utils
 from dbwrapper import *
+# only needed by a few commands, so they are loaded the first time one of those runs
+gtts = utils.lazy_import("gtts")
+googletrans = utils.lazy_import("googletrans")
+urllib_request = utils.lazy_import("urllib.request")
 blacklisted = []
 
 info = json.loads(open("configs.json").read())
 
-async def getprefix(bot,message:discord.Member):
+async def load_prefix(guild_id):
     bot.db.set_collection("guilds")
-    m = await bot.db.find(length=2,id=message.guild.id)
-    if m:
-        m=[m[0]["prefix"]]
+    m = await bot.db.find(length=1,id=guild_id)
+    # "" marks a guild without a custom prefix, so that is shared and cached too
+    return m[0].get("prefix") or "" if m else ""
+
+async def getprefix(bot,message:discord.Member):
+    m = []
+    if message.guild is not None:
+        custom = await bot.shared.get("prefix:{}".format(message.guild.id),
+                                      functools.partial(load_prefix, message.guild.id))
+        if custom:
+            m = [custom]
     return commands.when_mentioned_or(*(list(info["bot"]["prefixes"])+m))(bot,message)
 
-bot = commands.Bot(description='Tune in to lots of fun with this bot!',
-                   command_prefix=getprefix)
+# set by launcher.py when the bot runs as one of several cluster processes
+shard_ids = os.environ.get("QUANTUM_SHARDS")
+bot = commands.AutoShardedBot(description='Tune in to lots of fun with this bot!',
+                              command_prefix=getprefix,
+                              shard_ids=[int(i) for i in shard_ids.split(",")] if shard_ids else None,
+                              shard_count=int(os.environ["QUANTUM_SHARD_COUNT"]) if shard_ids else None)
+bot.cluster=int(os.environ.get("QUANTUM_CLUSTER", 0))
+bot.shared=SharedState(os.environ.get("QUANTUM_STATE"))
 bot.db=GuildDB()
+bot.rates=RateTable(info["converter"]["symbols"],info["converter"]["access_key"]["1"])
+bot.xkcd=XkcdIndex()
+edit_filter=EditFilter(info["edits"]["window"])
+bot.command_log=CommandLog(**info["logging"])
+bot.metrics=Metrics(**info["metrics"])
+if shard_ids:
+    bot.metrics.cluster=bot.cluster
+    bot.metrics.path=bot.metrics.path.replace(".prom", "-{}.prom".format(bot.cluster))
+    bot.metrics.port=bot.metrics.port and bot.metrics.port + bot.cluster
+bot.metrics.latencies=lambda: bot.latencies
+bot.metrics.install(bot)
+bot.watchdog=LagMonitor(bot.metrics.running, **info["watchdog"])
+bot.watchdog.on_stall=functools.partial(bot.command_log.log, "stall")
+bot.scheduler=Scheduler(info["scheduler"]["jitter"])
+bot.scheduler.on_error=functools.partial(bot.command_log.log, "job error")
+bot.bootstrapped=False
+
+
+async def send_home(channel_id, content=None, embed=None):
+    '''
+    sends to one of the home guild's channels. Only the cluster holding that guild's shard has the channel,
+    the others post through the HTTP API instead
+    :return: the Message, None when the channel lives in another cluster
+    '''
+    channel = bot.get_channel(channel_id)
+    if channel is not None:
+        return await channel.send(content, embed=embed)
+    await bot.http.send_message(channel_id, content, embed=embed.to_dict() if embed else None)
+
 premium_embed=discord.Embed(title="This is a Premium feature.",description="In order to use this feature, please consider buying **Quantum Bot premium**. It's very cheap, at USD0.80 per month!",
                             colour=discord.Colour.dark_blue(),footer="Type \"q!premium buy\" for more info.")
 
@@ -183,22 +242,29 @@ class Feedback:
     async def feedback(self, ctx, *, message):
         '''My bot is not very good, feedback is appreciated!'''
         author = ctx.message.author.name + " said in " + "'" + ctx.guild.name + "'"
-        await bot.get_guild(413290013254615041).get_channel(413631317272690688).send(
-            embed=discord.Embed(color=eval(hex(ctx.author.color.value)), title=author,
-                                description="#" + ctx.channel.name + ":\n" + message))
+        await send_home(413631317272690688,
+                        embed=discord.Embed(color=eval(hex(ctx.author.color.value)), title=author,
+                                            description="#" + ctx.channel.name + ":\n" + message))
         await ctx.message.add_reaction('\u2705')
 
     @commands.command()
     async def suggest(self, ctx, command, *, description):
         '''suggest commands I should work on, and follow by a short description on how it works'''
         author = ctx.message.author.name
-        m = await bot.get_guild(413290013254615041).get_channel(413631317272690688).send(
-            embed=discord.Embed(title=author + " suggested a command '" + command + "'", description=description,
-                                color=ctx.author.color))
+        m = await send_home(413631317272690688,
+                            embed=discord.Embed(title=author + " suggested a command '" + command + "'",
+                                                description=description, color=ctx.author.color))
+        if m is None:
+            # the reactions on it go to the cluster with the home guild, this one can't wait for the verdict
+            return await ctx.message.add_reaction('\u2705')
+        router = get_reaction_router(bot)
+        session = router.register(m.id, users=info["hierarchy"]["owner"], emojis=["\u2705", "\u274C"])
         await m.add_reaction("\u2705")
         await m.add_reaction("\u274C")
-        r = await bot.wait_for('reaction_add', check=lambda reaction, author: (author.id == info["hierarchy"]["owner"]) and (
-                    reaction.emoji in ["\u2705", "\u274C"]))
+        try:
+            r = await session.wait()
+        finally:
+            router.unregister(m.id)
         if r[0].emoji == "\u2705":
             await ctx.author.send("Your command {} has been accepted by the owner.".format(command))
             await m.edit(embed=discord.Embed(title="Command to work on: " + command, description=description))
@@ -311,23 +377,14 @@ Server Region:{}\nMember count:{}\nOwner:{}\nCreated On:{}\nNumber of text chann
     @commands.command(name='help')
     async def _help(self, ctx, *, command: str = None):
         """Shows help about a command or the bot"""
-        try:
-            if command is None:
-                p = await HelpPaginator.from_bot(ctx)
-            else:
-                entity = bot.get_cog(command) or bot.get_command(command)
-
-                if entity is None:
-                    clean = command.replace('@', '@\u200b')
-                    return await ctx.send(f'Command or category "{clean}" not found.')
-                elif isinstance(entity, commands.Command):
-                    p = await HelpPaginator.from_command(ctx, entity)
-                else:
-                    p = await HelpPaginator.from_cog(ctx, entity)
-
-            await p.paginate()
-        except Exception as e:
-            await ctx.send(traceback.format_exception(None, e, e.__traceback__))
+        index = get_help_index(bot)
+        pages = index.lookup(command)
+        if pages is None:
+            clean = command.replace('@', '@\u200b')
+            close = index.suggest(command)
+            hint = "\nDid you mean: {}?".format(", ".join(f"`{name}`" for name in close)) if close else ""
+            return await ctx.send(f'Command or category "{clean}" not found.{hint}')
+        await SimplePaginator(extras=pages).paginate(ctx)
 
 
 class Fun:
@@ -405,14 +462,10 @@ class Fun:
                         await ctx.send(title="Morse conversion failed!", description="Unidentified character spotted!",
                                        colour=discord.Colour.red())
                         break
-        m = len(a) // 1900
-        for x in range(m):
-            await ctx.send(embed=discord.Embed(title="Page {}/{} of Morse Translation".format(x + 1, m + 1),
-                                               description="```\n" + a[1900 * x:1900 * (x + 1)] + "```",
-                                               colour=discord.Colour.dark_gold()))
-        await ctx.send(embed=discord.Embed(title="Page {}/{} of Morse Translation".format(m + 1, m + 1),
-                                           description="```\n" + a[1900 * m:] + "```",
-                                           colour=discord.Colour.dark_gold()))
+        sendlist = list(utils.chunks(a, fence=''))
+        for x, text in enumerate(sendlist):
+            await ctx.send(embed=discord.Embed(title="Page {}/{} of Morse Translation".format(x + 1, len(sendlist)),
+                                               description=text, colour=discord.Colour.dark_gold()))
 
     @commands.command()
     async def emojify(self, ctx, *, text='Hello'):
@@ -484,21 +537,27 @@ class Fun:
                 else:
                     text=""
             file = gtts.gTTS(speaking_language+" "+text)
-        file.save("Extras/gtts.mp3")
-        await ctx.send(file=discord.File("Extras/gtts.mp3"))
+        def speak():
+            fp = io.BytesIO()
+            file.write_to_fp(fp)
+            fp.seek(0)
+            return fp
+        async with ctx.typing():
+            fp = await upstreams['tts'].run_blocking(speak)
+        await ctx.send(file=discord.File(fp, "gtts.mp3"))
 
     @tts.command(name="langs")
     async def tts_langs(self,ctx):
         '''shows list of supported languages and their codes'''
+        tts_langs=gtts.lang.tts_langs()
         langs=[]
-        for key in gtts.lang.tts_langs():
-            langs.append("**%5s**"%key+": "+gtts.lang.tts_langs()[key])
-        embeds=[]
-        for i in range(len(langs)//15):
-            embeds.append(discord.Embed(title="List of available languages [{}/5]".format(i+1),
-                                        description="\n".join(langs[15*i:15*(i+1)]),
-                                        colour=discord.Colour.blurple()))
-        await SimplePaginator(extras=embeds).paginate(ctx)
+        for key in tts_langs:
+            langs.append("**%5s**"%key+": "+tts_langs[key])
+        total=-(-len(langs)//15)
+        embeds=(page(title="List of available languages [{}/{}]".format(i+1,total),
+                     description="\n".join(langs[15*i:15*(i+1)]),
+                     colour=discord.Colour.blurple()) for i in range(total))
+        await SimplePaginator(source=embeds).paginate(ctx)
 
 class Owner:
     '''commands only the bot owner can use, besides repl and exec'''
@@ -510,6 +569,9 @@ class Owner:
             await ctx.send("You're not the bot owner!")
         else:
             await ctx.send("Shutting down...")
+            await paginators.close()
+            await bot.scheduler.stop()
+            await bot.command_log.close()
             await bot.logout()
 
     @commands.command()
@@ -533,19 +595,84 @@ class Owner:
         people = info["hierarchy"]
         if ctx.author.id in people["owner"]+people["collaborators"]+people["premium"]:
             a = inspect.getsource(bot.get_command(command).callback)
-            m = len(a) // 1900
-            embedlist=[]
-            for x in range(m):
-                embedlist.append(discord.Embed(title="Page {}/{} of '{}' command".format(x + 1, m + 1, command),
-                                                   description="```py\n" + a[1900 * x:1900 * (x + 1)] + "```",
-                                                   colour=discord.Colour.dark_gold()))
-            embedlist.append(discord.Embed(title="Page {}/{} of '{}' command".format(m + 1, m + 1, command),
-                                               description="```py\n" + a[1900 * m:] + "```",
-                                               colour=discord.Colour.dark_gold()))
-            await SimplePaginator(extras=embedlist).paginate(ctx)
+            sendlist = list(utils.chunks(a, fence='py'))
+            embedlist = (page(title="Page {}/{} of '{}' command".format(x + 1, len(sendlist), command),
+                              description=text, colour=discord.Colour.dark_gold())
+                         for x, text in enumerate(sendlist))
+            await SimplePaginator(source=embedlist).paginate(ctx)
         else:
             await ctx.send(embed=premium_embed)
 
+    @commands.command()
+    async def upstreams(self, ctx):
+        '''shows the state of every third party API the bot depends on'''
+        if ctx.author.id not in info["hierarchy"]["owner"]:
+            return await ctx.send("You're not the bot owner!")
+        embed = discord.Embed(title="Upstream status", colour=discord.Colour.dark_blue())
+        for name, stat in upstream.stats().items():
+            embed.add_field(name="{} [{}]".format(name, stat.pop('state')),
+                            value="\n".join("{}: {}".format(k, v) for k, v in stat.items()))
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    async def watchers(self, ctx):
+        '''shows how many messages are being watched for edits and reactions, and paginator memory'''
+        if ctx.author.id not in info["hierarchy"]["owner"]:
+            return await ctx.send("You're not the bot owner!")
+        embed = discord.Embed(title="Watchers", colour=discord.Colour.dark_blue())
+        for name, router in (("Edits", get_router(bot)), ("Edit reruns", edit_filter), ("Reactions", get_reaction_router(bot)),
+                             ("Paginators", paginators), ("Command log", bot.command_log), ("Shared state", bot.shared)):
+            embed.add_field(name=name, value="\n".join("{}: {}".format(k, v) for k, v in router.stats().items()))
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    async def stats(self, ctx, phase="total"):
+        '''command latency percentiles, slowest first. phase is total, db, http or discord'''
+        if ctx.author.id not in info["hierarchy"]["owner"]:
+            return await ctx.send("You're not the bot owner!")
+        rows = bot.metrics.summary(phase)
+        if not rows:
+            return await ctx.send("No {} timings recorded yet.".format(phase))
+        lines = ["{:<16}{:>6}{:>9}{:>9}{:>9}".format("command", "calls", "p50 ms", "p95 ms", "p99 ms")]
+        lines += ["{:<16}{:>6}{:>9.1f}{:>9.1f}{:>9.1f}".format(*row) for row in rows]
+        sendlist = list(utils.chunks("\n".join(lines), fence=''))
+        await SimplePaginator(extras=[page(title="Command latency ({}) {}/{}".format(phase, i, len(sendlist)),
+                                           description=text, colour=discord.Colour.dark_blue())
+                                      for i, text in enumerate(sendlist, 1)]).paginate(ctx)
+
+    @commands.command()
+    async def jobs(self, ctx):
+        '''the background jobs and how their runs went'''
+        if ctx.author.id not in info["hierarchy"]["owner"]:
+            return await ctx.send("You're not the bot owner!")
+        embed = discord.Embed(title="Scheduled jobs", colour=discord.Colour.dark_blue())
+        for name, stats in bot.scheduler.stats().items():
+            embed.add_field(name=name, value="\n".join("{}: {}".format(k, v) for k, v in stats.items()))
+        await ctx.send(embed=embed)
+
+    @commands.command()
+    async def blockers(self, ctx, detail: int = 0):
+        '''what stalled the event loop the longest, give a rank to see its stack'''
+        if ctx.author.id not in info["hierarchy"]["owner"]:
+            return await ctx.send("You're not the bot owner!")
+        watchdog = bot.watchdog
+        ranking = watchdog.ranking()
+        if detail:
+            if not 0 < detail <= len(ranking):
+                return await ctx.send("There is no blocker ranked {}.".format(detail))
+            (command, where), entry = ranking[detail - 1]
+            return await ctx.send(embed=discord.Embed(title="{} - {}".format(command, where), colour=discord.Colour.dark_blue(),
+                                                      description=next(utils.chunks(entry["stack"], fence="py"))))
+        embed = discord.Embed(title="Event loop lag", colour=discord.Colour.dark_blue(),
+                              description="p50 {:.1f}ms, p99 {:.1f}ms, max {:.1f}ms, {} stalls over {:.0f}ms".format(
+                                  watchdog.lag.percentile(50), watchdog.lag.percentile(99), watchdog.lag.max,
+                                  watchdog.stalls, watchdog.threshold * 1000))
+        for rank, ((command, where), entry) in enumerate(ranking, 1):
+            embed.add_field(name="{}. {}".format(rank, command), inline=False,
+                            value="`{}`\n{} stalls, {:.0f}ms total, {:.0f}ms worst".format(
+                                where, entry["count"], entry["total"], entry["max"]))
+        await ctx.send(embed=embed)
+
     @commands.command(pass_context=True)
     async def warn(self, ctx, member: discord.Member, serious: bool, *, reason):
         '''for owner to issue warnings'''
@@ -604,7 +731,6 @@ class Pystuff():
                 await ctx.send("Argument [command name] must be provided!")
             else:
                 try:
-                    embeds = []
                     sio = io.StringIO()
                     with contextlib.redirect_stdout(sio):
                         command.replace("print","")
@@ -612,15 +738,10 @@ class Pystuff():
                     sio.seek(0)
                     a = sio.getvalue()
                     sio = None
-                    for i in range(1, len(a) // 1950 + 1):
-                        embeds.append(discord.Embed(title="Python help Page [%d/%d]" % (i, len(a) // 1950 + 1),
-                                                    description="```{}```".format(a[1950 * (i - 1):1950 * i]),
-                                                    color=ctx.author.color))
-                    embeds.append(
-                        discord.Embed(title="Python help Page [%d/%d]" % (len(a) // 1950 + 1, len(a) // 1950 + 1),
-                                      description="```{}```".format(a[1950 * (len(a) // 1950):]),
-                                      color=ctx.author.color))
-                    await SimplePaginator(extras=embeds).paginate(ctx)
+                    sendlist = list(utils.chunks(a, fence=''))
+                    embeds = (page(title="Python help Page [%d/%d]" % (i, len(sendlist)), description=text,
+                                   color=ctx.author.color) for i, text in enumerate(sendlist, 1))
+                    await SimplePaginator(source=embeds).paginate(ctx)
                 except NameError:
                     await ctx.send(
                         embed=discord.Embed(title="Error raised!", description="Object %s is not found!" % command))
@@ -628,7 +749,7 @@ class Pystuff():
     @commands.command()
     async def pypi(self, ctx, search):
         '''searches information about the PyPI for the module you want'''
-        base = "https://pypi.org/pypi/{}/json".format(urllib.request.pathname2url(search))
+        base = "https://pypi.org/pypi/{}/json".format(urllib.parse.quote(search))
         try:
             f = await utils.getjson(base)
             embed = discord.Embed(title="Details about the PyPI module {}".format(search),
@@ -657,18 +778,13 @@ class Pystuff():
     @commands.command()
     async def pypisearch(self, ctx, module):
         '''gets a list of PyPI modules with roughly similar names'''
-        async with aiohttp.ClientSession() as session:
-            async with session.get("https://pypi.org/search/?" + urllib.parse.urlencode({"q": module})) as response:
-                f = await response.text()
-        indicess = list(utils.find('<h3 class="package-snippet__title">', f))
-        indicese = list(utils.find('</h3>', f))
-        modules = []
-        for i in range(len(indicess)):
-            e = (f[indicess[i]:indicese[i]])
-            namestart = list(utils.find('<span class="package-snippet__name">', e))[0] + 36
-            verstart = list(utils.find('<span class="package-snippet__version">', e))[0] + 39
-            spans = list(utils.find('</span>', e))
-            modules.append(f"{e[namestart:spans[0]]}: v{e[verstart:spans[1]]}")
+        try:
+            results = await pypiparser.search(module)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return await ctx.send(embed=discord.Embed(title="PyPI Search Unavailable",
+                                                      description="PyPI could not be searched, try again later.",
+                                                      colour=discord.Colour.red()))
+        modules = [f"{name}: v{version}" for name, version, _ in results] or ["No results found."]
         send = discord.Embed(title=f"PyPI search results for {module}", colour=ctx.author.colour,
                              description="```" + "\n".join(modules) + "```")
         await ctx.send(embed=send)
@@ -683,7 +799,7 @@ class Media:
         embed = discord.Embed(title="Youtube search for " + youtube, color=eval(hex(ctx.author.color.value)))
         try:
             query_string = urllib.parse.urlencode({'search_query': youtube, })
-            html_content = urllib.request.urlopen('http://www.youtube.com/results?' + query_string)
+            html_content = urllib_request.urlopen('http://www.youtube.com/results?' + query_string)
             search_results = re.findall('href=\\"\\/watch\\?v=(.{11})', html_content.read().decode())
             if len(search_results) >= 3:
                 embed.add_field(name="Top result", value='http://www.youtube.com/watch?v=' + search_results[0])
@@ -702,7 +818,8 @@ class Media:
         '''Search Google for something'''
         content = []
         async with ctx.typing():
-            m = await utils.getjson("http://api.tanvis.xyz/search/" + urllib.request.pathname2url(query))
+            m = await upstreams['tanvis'].getjson("http://api.tanvis.xyz/search/" + urllib.parse.quote(query),
+                                                  key=('search', query.lower()))
         for i in m:
             content.append(i['link'])
         embed = discord.Embed(title="'%s' search results:" % query, description="\n".join(content),
@@ -713,53 +830,43 @@ class Media:
     @commands.command(aliases=['wiki'])
     async def wikipedia(self, ctx, *, anything):
         '''look through wikipedia for what you want'''
-        wew = urllib.request.pathname2url(anything)
-        f = await utils.getjson(
-            f"https://en.wikipedia.org/w/api.php?action=query&format=json&prop=extracts&indexpageids=1&redirects=1&explaintext=1&exsectionformat=plain&titles={wew}")
-        query = f['query']
-        pageids = query['pageids']
-        title = list(query['pages'].values())[0]['title']
-        extract = list(query['pages'].values())[0]['extract']
-        texts=utils.partition(extract,1000)
-        embedlist=[discord.Embed(title=title+" Page {}/{}".format(i+1,len(texts)),description=texts[i],colour=discord.Colour.lighter_grey()).set_thumbnail(url="https://images-ext-1.discordapp.net/external/CYCtSp1meQ0f_ZFd5y0T14UlI_xvqqLWPjUJ2gINt58/https/en.wikipedia.org/static/images/project-logos/enwiki.png") for i in range(len(texts))]
-        await SimplePaginator(extras=embedlist).paginate(ctx)
+        article = await Article.fetch(anything)
+        if article is None:
+            return await ctx.send(embed=discord.Embed(title="Article not found",
+                                                      description=f"Wikipedia has no article called **{anything}**.",
+                                                      colour=discord.Colour.red()))
+        embedlist, more = article.pager()
+        if not embedlist:
+            embedlist = await more()
+        await SimplePaginator(extras=embedlist, more=more).paginate(ctx)
 
     @commands.command()
     async def xkcd(self, ctx, num: int = None):
         '''read the famous comic strip, leaving blank gets random comic'''
+        if num == 404:
+            m = discord.Embed(title="xkcd #404: Think again, does it exist?",
+                              description="This came between Monday and Wednesday, 2 consecutive days of xkcd comic publication. This can be considered an April Fools prank or a reference to the 404 Error: Not Found")
+            m.set_image(url='https://www.explainxkcd.com/wiki/images/9/92/not_found.png')
+            return await ctx.send(embed=m)
         try:
-            async with ctx.typing():
-                if num is None: num = random.randint(1, 1996)
-                url = f'https://xkcd.com/{num}/info.0.json'
-                f = await utils.getjson(url)
-                m = discord.Embed(colour=discord.Color.from_rgb(245, 245, 220),
-                                  title="xkcd #{}:{}".format(str(f['num']), f['safe_title']),
-                                  description=f['transcript'], timestamp=datetime.datetime.now())
-                m.set_image(url=f['img'])
-                m.add_field(name="Links", value=f['img'] + '\nhttps://xkcd.com/' + str(f['num']))
-                m.add_field(name="Publication date:", value=f['day'] + '/' + f['month'] + '/' + f['year'], inline=False)
-            await ctx.send(embed=m)
-        except:
-            if num == 404:
-                m = discord.Embed(title="xkcd #404: Think again, does it exist?",
-                                  description="This came between Monday and Wednesday, 2 consecutive days of xkcd comic publication. This can be considered an April Fools prank or a reference to the 404 Error: Not Found")
-                m.set_image(url='https://www.explainxkcd.com/wiki/images/9/92/not_found.png')
-            else:
-                await ctx.send("Fetching your a random xkcd comic...", delete_after=2)
+            f = bot.xkcd.comics.get(num)
+            if f is None:
                 async with ctx.typing():
-                    num = random.randint(1, 1996)
-                    url = f'https://xkcd.com/{num}/info.0.json'
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(url) as response:
-                            f = await response.json(encoding='utf8')
-                    m = discord.Embed(colour=discord.Color.from_rgb(245, 245, 220),
-                                      title="xkcd #{}:{}".format(str(f['num']), f['safe_title']),
-                                      description=f['transcript'], timestamp=datetime.datetime.now())
-                    m.set_image(url=f['img'])
-                    m.add_field(name="Links", value=f['img'] + '\nhttps://xkcd.com/' + str(f['num']))
-                    m.add_field(name="Publication date:", value=f['day'] + '/' + f['month'] + '/' + f['year'],
-                                inline=False)
-            await ctx.send(embed=m)
+                    f = await (bot.xkcd.random() if num is None else bot.xkcd.get(num))
+                    if f is None:
+                        await ctx.send("That comic does not exist, fetching you a random xkcd comic...", delete_after=2)
+                        f = await bot.xkcd.random()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return await ctx.send("xkcd could not be reached. Please try again.", delete_after=3)
+        if f is None:
+            return await ctx.send("No xkcd comics are indexed yet. Please try again in a minute.", delete_after=3)
+        m = discord.Embed(colour=discord.Color.from_rgb(245, 245, 220),
+                          title="xkcd #{}:{}".format(str(f['num']), f['safe_title']),
+                          description=f['transcript'], timestamp=datetime.datetime.now())
+        m.set_image(url=f['img'])
+        m.add_field(name="Links", value=f['img'] + '\nhttps://xkcd.com/' + str(f['num']))
+        m.add_field(name="Publication date:", value=f['day'] + '/' + f['month'] + '/' + f['year'], inline=False)
+        await ctx.send(embed=m)
 
     @commands.cooldown(rate=1, per=8, type=commands.BucketType.guild)
     @commands.command()
@@ -767,8 +874,8 @@ class Media:
         '''to get the weather of a given location'''
         try:
             async with ctx.typing():
-                url = "http://api.tanvis.xyz/weather/" + urllib.request.pathname2url(location)
-                f = await utils.getjson(url)
+                url = "http://api.tanvis.xyz/weather/" + urllib.parse.quote(location)
+                f = await upstreams['tanvis'].getjson(url, key=('weather', location.lower()))
                 if 'error' in f:
                     await ctx.send(embed=discord.Embed(title="An error occurred",
                                                        description="I could not find your given location",
@@ -784,6 +891,8 @@ class Media:
                     embed.set_thumbnail(url=f['icon'])
                     embed.set_footer(text="using **tanvis.xyz** API")
                     await ctx.send(embed=embed)
+        except UpstreamUnavailable as e:
+            await ctx.send(str(e), delete_after=5)
         except:
             await ctx.send("An error occurred. Please try again.", delete_after=3)
 
@@ -794,7 +903,8 @@ class Media:
         language = 'en'
         word_id = word
         url = 'https://od-api.oxforddictionaries.com:443/api/v1/entries/' + language + '/' + word_id.lower()
-        r = __import__("requests").get(url, headers={'app_id': info["dict"]["app_id"], 'app_key': info["dict"]["app_key"]})
+        r = await upstreams['oxford'].run_blocking(__import__("requests").get, url, timeout=8, key=word_id.lower(),
+                                                   headers={'app_id': info["dict"]["app_id"], 'app_key': info["dict"]["app_key"]})
         definitions = {}
         if r.status_code == 200:
             for i in r.json()["results"]:
@@ -858,8 +968,9 @@ class Media:
             if dest not in list(info["languages"].keys()) + list(info["languages"].values()):
                 dest = "en"
             async with ctx.typing():
-                translator = Translator()
-                f = translator.translate(message, dest=dest, src=src)
+                translator = googletrans.Translator()
+                f = await upstreams['translate'].run_blocking(translator.translate, message, dest=dest, src=src,
+                                                              key=(message, src, dest))
                 sourcelang = info["languages"][f.src] + "({})".format(f.src)
                 destlang = info["languages"][f.dest] + "({})".format(f.dest)
                 embed = discord.Embed(title="Translation output", colour=discord.Colour.from_rgb(79, 255, 176))
@@ -906,7 +1017,7 @@ class Images:
 
 class Data:
     '''these commands store data'''
-    @commands.cooldown(rate=1, per=5)
+    @shared_cooldown(rate=1, per=5)
     @commands.command()
     async def customprefix(self, ctx, prefix: str = None):
         '''sets the custom bot prefix for your guild, sets the prefix if you specified any, provided no spaces'''
@@ -929,6 +1040,7 @@ class Data:
                         res["prefix"]=prefix
                         m.load(res)
                         await m.send()
+                        await bot.shared.set("prefix:{}".format(ctx.guild.id), prefix)
                         embed = discord.Embed(title="Successfully set this guild's custom prefix!",
                                               colour=discord.Colour.dark_green())
                     else:
@@ -945,6 +1057,7 @@ class Data:
                         m=Guild()
                         m.load({"id":res["id"],"prefix":prefix})
                         await m.send()
+                        await bot.shared.set("prefix:{}".format(ctx.guild.id), prefix)
                         embed = discord.Embed(title="Successfully set this guild's custom prefix!",
                                               description="This is the first time you're setting my custom prefix!!",
                                               colour=discord.Colour.dark_green())
@@ -1082,25 +1195,26 @@ class Beta:
 
     @commands.cooldown(rate=1,per=5)
     @convert.command(name="money")
-    async def convert_money(self, ctx, value:int, from_val:str, to_val:str):
-        """converts the currencies you want"""
+    async def convert_money(self, ctx, value:float, from_val:str, *to_vals:str):
+        """converts the currencies you want, give more than one destination to convert to all of them"""
         if ctx.author.id in info["hierarchy"]["premium"]+info["hierarchy"]["collaborators"]+info["hierarchy"]["owner"]:
             value=abs(value)
-            if from_val.upper() not in info["converter"]["symbols"].keys() or to_val.upper() not in info["converter"]["symbols"]:
+            if not to_vals or from_val not in bot.rates or any(i not in bot.rates for i in to_vals):
                 await ctx.send(embed=discord.Embed(title="Currency not found",description="Type `Q!convert list` to see all available currencies.",colour=discord.Colour.red()))
+            elif not bot.rates.ready:
+                await ctx.send("Sorry {} but the service is currently unavailable.".format(ctx.author.mention))
             else:
-                res=await utils.getjson("http://data.fixer.io/api/convert?access_key={}&from={}&to={}&amount={}".format(info["converter"]["access_key"],from_val,to_val,value))
-                print(res)
-                if res["success"]:
-                    rate=res["info"]["rate"]
-                    val =res["result"]
-                    embed=discord.Embed(title="Currency Conversion Result",colour=discord.Colour.dark_gold())
-                    embed.add_field(name=from_val,value=str(value))
-                    embed.add_field(name=to_val,value=str(val),inline=False)
-                    embed.add_field(name="Current Conversion Rate",value="1{} = {}{}".format(from_val,rate,to_val))
-                    await ctx.send(embed=embed)
-                else:
-                    await ctx.send("Sorry {} but the service is currently unavailable.".format(ctx.author.mention))
+                try:
+                    results=bot.rates.convert(value,from_val,*to_vals)
+                except KeyError as e:
+                    return await ctx.send(embed=discord.Embed(title="Rate not available",description="There is no rate for {} right now.".format(e.args[0].upper()),colour=discord.Colour.red()))
+                from_val=from_val.upper()
+                embed=discord.Embed(title="Currency Conversion Result",colour=discord.Colour.dark_gold())
+                embed.add_field(name=from_val,value=str(value),inline=False)
+                for to_val,rate,val in results:
+                    embed.add_field(name=to_val,value="{:,.4f}\n1{} = {:.6g}{}".format(val,from_val,rate,to_val))
+                embed.set_footer(text="Rates from fixer.io, updated {:%B %d, %Y at %H:%M GMT}".format(datetime.datetime.utcfromtimestamp(bot.rates.timestamp)))
+                await ctx.send(embed=embed)
         else:
             await ctx.send(embed=premium_embed)
 
@@ -1166,51 +1280,118 @@ async def on_raw_reaction_add(reaction):
 
 @bot.event
 async def on_command(ctx):
-    if ctx.command.name not in "execrepl":
-        print("Invocation of "+ctx.command.name+" by "+ctx.author.name)
+    ctx.started = time.monotonic()
+
+
+def command_fields(ctx):
+    started = getattr(ctx, "started", None)
+    return {"command": ctx.command.qualified_name if ctx.command else None,
+            "guild": ctx.guild.id if ctx.guild else None, "channel": ctx.channel.id, "user": ctx.author.id,
+            "latency_ms": None if started is None else round((time.monotonic() - started) * 1000, 2)}
+
+
+@bot.event
+async def on_command_completion(ctx):
+    bot.command_log.log("command", outcome="ok", **command_fields(ctx))
 
 @bot.event
 async def on_command_error(ctx, error):
+    event = "unknown" if isinstance(error, commands.CommandNotFound) else "error"
+    bot.command_log.log(event, outcome=type(error).__name__, error=str(error), **command_fields(ctx))
     if type(error) == discord.ext.commands.errors.CommandOnCooldown:
         await ctx.send(
             embed=discord.Embed(title="Woah woah slow down!", description=error.args[0], colour=discord.Colour.red()))
+    elif isinstance(error, commands.CommandInvokeError) and isinstance(error.original, UpstreamUnavailable):
+        await ctx.send(
+            embed=discord.Embed(title="Service unavailable", description=str(error.original), colour=discord.Colour.red()),
+            delete_after=10)
     else:
         embed = discord.Embed(title=str(type(error))[8:-2], description=str(error),
                               colour=discord.Colour.from_rgb(random.randint(0, 255), random.randint(0, 255),
                                                              random.randint(0, 255)))
         await ctx.send("***Roses are red, violets are blue, there is an error when the command is used by you***",
                        embed=embed, delete_after=15)
-        for i in (traceback.format_exception(None, error, error.__traceback__)):
-            print(i, end="")
+        if event == "unknown":
+            # a mistyped command has no traceback worth keeping, and its record is sampled above
+            return
+        bot.command_log.log("traceback", command=ctx.command.qualified_name if ctx.command else None,
+                            traceback="".join(traceback.format_exception(None, error, error.__traceback__)))
 
 
 @bot.event
 async def on_guild_join(guild):
     embed = discord.Embed(title="Guild joined!", colour=discord.Colour.green())
     embed.add_field(name=guild.name, value="Owner:%s" % guild.owner)
-    await bot.get_guild(413290013254615041).get_channel(463261256355282944).send(embed=embed)
+    await send_home(463261256355282944, embed=embed)
 
 
 @bot.event
 async def on_guild_remove(guild):
     embed = discord.Embed(title="Guild left :(", colour=discord.Colour.red())
     embed.add_field(name=guild.name, value="Owner:%s" % guild.owner)
-    await bot.get_guild(413290013254615041).get_channel(463261256355282944).send(embed=embed)
+    await send_home(463261256355282944, embed=embed)
 
 
 @bot.event
 async def on_message(message):
     # add stuff here when you want to
+    bot.metrics.shard_event(message.guild.shard_id if message.guild else 0)
+    edit_filter.seen(message)
     await bot.process_commands(message)
 
 
 @bot.event
 async def on_message_edit(before, after):
-    await bot.process_commands(after)
+    # messages with a live watcher are re-run by their own edit handler, when it takes the edit
+    if await get_router(bot).dispatch(before, after):
+        return
+    if edit_filter.should_dispatch(before, after):
+        await bot.process_commands(after)
 
 
 @bot.event
 async def on_ready():
+    # on_ready fires again after every reconnect, the bootstrap below must only ever run once
+    if bot.bootstrapped:
+        bot.command_log.log("reconnect", guilds=len(bot.guilds))
+        return
+    bot.bootstrapped = True
+    add_cogs()
+    # the periodic jobs start before anything below can fail, the premium list is loaded by its first run
+    jobs = info["scheduler"]
+    bot.scheduler.add("presence", change_activity, jobs["presence"])
+    bot.scheduler.add("premium", refresh_premium, jobs["premium"], delay=0)
+    bot.scheduler.add("rates", bot.rates.refresh_if_stale, jobs["rates"], delay=0)
+    bot.scheduler.add("xkcd", bot.xkcd.update, bot.xkcd.interval, delay=0)
+    bot.scheduler.add("command log", bot.command_log.flush, bot.command_log.interval)
+    bot.scheduler.add("metrics", bot.metrics.export, bot.metrics.interval)
+    bot.scheduler.start(bot.loop)
+    bot.metrics.start(bot.loop)
+    bot.watchdog.start(bot.loop)
+    try:
+        await bot.change_presence(activity=discord.Game(name='Type [q?help] for help', type=2), status=discord.Status.dnd)
+        await bot.db.add_collection("bumps")
+        await bot.db.add_collection("guilds")
+        # one announcement per deploy, not one per cluster
+        if bot.cluster == 0:
+            await announce_update()
+    except Exception as e:
+        bot.command_log.log("bootstrap error", error="{}: {}".format(type(e).__name__, e))
+    print("Bot works, go on.")
+
+
+async def announce_update():
+    if __file__ == r"C:/Users/vengat/Desktop/Bot/Quantum Bot/code.py":
+        await send_home(436548366088798219, embed=discord.Embed(title="Beta Bot Update tested on:",
+                                                                description=f"{datetime.datetime.utcnow(): %B %d, %Y at %H:%M:%S GMT}",
+                                                                colour=discord.Colour.blue()))
+    else:
+        await send_home(436548366088798219, embed=discord.Embed(title="Bot Updated on:",
+                                                                description=f"{datetime.datetime.utcnow(): %B %d, %Y at %H:%M:%S GMT}",
+                                                                colour=discord.Colour.dark_gold()))
+
+
+def add_cogs():
     bot.remove_command('help')
     bot.load_extension('code2')
     bot.add_cog(Owner())
@@ -1225,31 +1406,25 @@ async def on_ready():
     bot.add_cog(Images())
     bot.add_cog(Data())
     bot.add_cog(Beta())
-    await bot.change_presence(activity=discord.Game(name='Type [q?help] for help', type=2), status=discord.Status.dnd)
-    f = bot.get_guild(413290013254615041).get_channel(436548366088798219)
-    await bot.db.add_collection("bumps")
-    await bot.db.add_collection("guilds")
-    if __file__ == r"C:/Users/vengat/Desktop/Bot/Quantum Bot/code.py":
-        await f.send(embed=discord.Embed(title="Beta Bot Update tested on:",
-                                         description=f"{datetime.datetime.utcnow(): %B %d, %Y at %H:%M:%S GMT}",
-                                         colour=discord.Colour.blue()))
-    else:
-        await f.send(embed=discord.Embed(title="Bot Updated on:",
-                                         description=f"{datetime.datetime.utcnow(): %B %d, %Y at %H:%M:%S GMT}",
-                                         colour=discord.Colour.dark_gold()))
+    get_help_index(bot).build()
+
+
+async def change_activity():
+    possb = 'Type [{}help] for help'.format(random.choice(info["bot"]["prefixes"]))
+    await bot.change_presence(activity=discord.Game(possb), status=discord.Status.dnd)
+
+
+async def load_premium():
     bot.db.set_collection("bumps")
     m = await bot.db.find(length=1000, premium=True)
-    info["hierarchy"]["premium"] = [i["author"] for i in m]
-    print("Bot works, go on.")
+    return [i["author"] for i in m]
+
 
-    async def change_activities():
-        timeout = 5  # Here you can change the delay between changes
-        while True:
-            possb = 'Type [{}help] for help'.format(random.choice(info["bot"]["prefixes"]))
-            await bot.change_presence(activity=discord.Game(possb, status=discord.Status.dnd))
-            await asyncio.sleep(timeout)
-    bot.loop.create_task(change_activities())
+async def refresh_premium():
+    # the first cluster to ask loads the list from the database, the rest get it from the shared state
+    info["hierarchy"]["premium"] = await bot.shared.get("premium", load_premium, ttl=info["scheduler"]["premium"])
 
 
-bot.run(info["bot"]["token"])
+if __name__ == "__main__":
+    bot.run(info["bot"]["token"])
 # ok
\ No newline at end of file
@@ -9,7 +9,7 @@ import inspect
 import textwrap
 from contextlib import redirect_stdout
 import io
-from simplepaginator import SimplePaginator
+from simplepaginator import SimplePaginator, page
 import quantumutils as utils
 import json
 oof=json.loads(open("configs.json").read())["hierarchy"]
@@ -58,25 +58,20 @@ class REPL():
         func = env['func']
         try:
             with redirect_stdout(stdout):
-                start=datetime.datetime.now()
+                start=time.perf_counter()
                 ret = await func()
         except Exception as e:
-            end=datetime.datetime.now()
-            time_diff=(end-start).microseconds/1000
+            time_diff=round((time.perf_counter()-start)*1000, 3)
             await ctx.message.add_reaction('\u274C')
             value = stdout.getvalue()
-            value=('py\n{}{}\n'.format(value, traceback.format_exc()))
-            sendlist = list(map(lambda x: "```" + x + "```", utils.partition(value, 1950)))
-            see = ""
-            embedlist = []
-            for i in range(len(sendlist)):
-                embedlist.append(
-                    discord.Embed(title="Page {}/{} of error".format(i + 1, len(sendlist)), description=sendlist[i],
-                                  colour=discord.Colour.red()).set_footer(text="Executed in {}ms".format(time_diff)))
-            await SimplePaginator(extras=embedlist).paginate(ctx)
+            value = '{}{}'.format(value, traceback.format_exc())
+            sendlist = list(utils.chunks(value, fence='py'))
+            pages = (page(title="Page {}/{} of error".format(i + 1, len(sendlist)), description=text,
+                          colour=discord.Colour.red(), footer="Executed in {}ms".format(time_diff))
+                     for i, text in enumerate(sendlist))
+            await SimplePaginator(source=pages).paginate(ctx)
         else:
-            end=datetime.datetime.now()
-            time_diff=(end-start).microseconds/1000
+            time_diff=round((time.perf_counter()-start)*1000, 3)
             value = stdout.getvalue()
             try:
                 await ctx.message.add_reaction('\u2705')
@@ -89,15 +84,11 @@ class REPL():
             else:
                 self._last_result = ret
                 sendable=str(value)+str(ret)
-            sendlist=list(map(lambda x: "```"+x+"```",utils.partition(sendable,1950)))
-            see=""
-            embedlist=[]
-            for i in range(len(sendlist)):
-                embedlist.append(
-                    discord.Embed(title="Page {}/{} of output".format(i + 1, len(sendlist)), description=sendlist[i],
-                                  colour=discord.Colour.blurple()).set_footer(
-                        text="Executed in {} ms".format(time_diff)))
-            await SimplePaginator(extras=embedlist).paginate(ctx)
+            sendlist = list(utils.chunks(sendable, fence=''))
+            pages = (page(title="Page {}/{} of output".format(i + 1, len(sendlist)), description=text,
+                          colour=discord.Colour.blurple(), footer="Executed in {} ms".format(time_diff))
+                     for i, text in enumerate(sendlist))
+            await SimplePaginator(source=pages).paginate(ctx)
 
     @commands.command()
     async def repl(self, ctx):
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import os
+import random
+import time
+
+
+class CommandLog:
+    '''
+    structured records of command invocations, queued without blocking and written
+    in batches to rotating JSON lines files whenever flush runs
+    :param path: the log file, rotated copies get .1, .2, ... appended
+    :param max_bytes: size the file may reach before it is rotated
+    :param backups: how many rotated copies are kept
+    :param sample: fraction of records kept per event, events not listed are all kept
+    '''
+
+    def __init__(self, path="Extras/logs/commands.jsonl", max_bytes=5 * 2 ** 20, backups=5, sample=None,
+                 batch=500, interval=2.0, maxsize=10000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.sample = sample or {}
+        self.batch = batch
+        self.interval = interval
+        self.queue = asyncio.Queue(maxsize)
+        self.counters = {'queued': 0, 'sampled out': 0, 'dropped': 0, 'written': 0, 'batches': 0, 'rotations': 0}
+
+    def log(self, event, **fields):
+        """
+        queues a record, never waits: a full queue drops it and counts the drop
+        :param event: kind of record, also what sample is keyed by
+        :param fields: anything json can write
+        """
+        rate = self.sample.get(event, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            self.counters['sampled out'] += 1
+            return
+        fields['event'] = event
+        fields['time'] = round(time.time(), 3)
+        try:
+            self.queue.put_nowait(fields)
+        except asyncio.QueueFull:
+            self.counters['dropped'] += 1
+        else:
+            self.counters['queued'] += 1
+
+    def drain(self):
+        records = []
+        while len(records) < self.batch and not self.queue.empty():
+            records.append(self.queue.get_nowait())
+        return records
+
+    def write(self, records):
+        lines = ''.join(json.dumps(record, default=str) + '\n' for record in records)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if os.path.exists(self.path) and os.path.getsize(self.path) + len(lines) > self.max_bytes:
+            self.rotate()
+        with open(self.path, 'a', encoding='utf8') as f:
+            f.write(lines)
+
+    def rotate(self):
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(self.path, i)):
+                os.replace('{}.{}'.format(self.path, i), '{}.{}'.format(self.path, i + 1))
+        if self.backups:
+            os.replace(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self.counters['rotations'] += 1
+
+    async def flush(self):
+        loop = asyncio.get_event_loop()
+        while not self.queue.empty():
+            records = self.drain()
+            try:
+                await loop.run_in_executor(None, self.write, records)
+            except OSError:
+                self.counters['dropped'] += len(records)
+                continue
+            self.counters['written'] += len(records)
+            self.counters['batches'] += 1
+
+    async def close(self):
+        await self.flush()
+
+    def stats(self):
+        return dict(self.counters, pending=self.queue.qsize())
@@ -0,0 +1,127 @@
+import array
+import asyncio
+import json
+import os
+import time
+from upstream import upstreams
+
+latest_url = "http://data.fixer.io/api/latest?access_key={}"
+
+
+class RateTable:
+    '''
+    keeps the full fixer.io rates table locally and converts any pair through cross rates
+    the rates are stored in an array of doubles indexed by the position of each symbol
+    in the symbols list, a value of 0.0 means the rate is not known
+    '''
+
+    def __init__(self, symbols, access_key, path="Extras/rates.json", interval=3600):
+        self.symbols = list(symbols)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.rates = array.array('d', bytes(8 * len(self.symbols)))
+        self.access_key = access_key
+        self.path = path
+        self.interval = interval
+        self.base = None
+        self.timestamp = 0
+        self.fetched_at = 0
+        self.load()
+
+    def __contains__(self, symbol):
+        return symbol.upper() in self.index
+
+    @property
+    def ready(self):
+        return self.base is not None
+
+    def fill(self, base, rates: dict, timestamp, fetched_at=None):
+        """
+        replaces the stored table with a fresh one
+        :param base: the symbol every rate is relative to
+        :param rates: mapping of symbol to rate against the base
+        :param timestamp: unix time the rates were published at
+        :param fetched_at: unix time the rates were downloaded at, now when None
+        """
+        table = array.array('d', bytes(8 * len(self.symbols)))
+        for symbol, rate in rates.items():
+            i = self.index.get(symbol)
+            if i is not None:
+                table[i] = float(rate)
+        self.rates = table
+        self.base = base
+        self.timestamp = timestamp
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+    def rate(self, from_val: str, to_val: str) -> float:
+        """
+        gets the cross rate between two currencies
+        :param from_val: the source symbol
+        :param to_val: the destination symbol
+        :return: how much 1 from_val is worth in to_val
+        """
+        a = self.rates[self.index[from_val.upper()]]
+        b = self.rates[self.index[to_val.upper()]]
+        if not a or not b:
+            raise KeyError(from_val if not a else to_val)
+        return b / a
+
+    def convert(self, value, from_val: str, *to_vals: str) -> list:
+        """
+        converts an amount into one or more currencies
+        :param value: the amount to convert
+        :param from_val: the source symbol
+        :param to_vals: the destination symbols
+        :return: a list of (symbol, rate, result) tuples
+        """
+        res = []
+        for to_val in to_vals:
+            r = self.rate(from_val, to_val)
+            res.append((to_val.upper(), r, value * r))
+        return res
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        try:
+            self.fill(data["base"], dict(zip(data["symbols"], data["rates"])), data["timestamp"],
+                      data.get("fetched_at", data["timestamp"]))
+        except (KeyError, TypeError, ValueError):
+            # a file from another version or edited by hand, start empty and let the next refresh replace it
+            return
+
+    def write(self, data):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps(data))
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        data = {"base": self.base, "timestamp": self.timestamp, "fetched_at": self.fetched_at,
+                "symbols": self.symbols, "rates": list(self.rates)}
+        await asyncio.get_event_loop().run_in_executor(None, self.write, data)
+
+    async def refresh(self):
+        """
+        downloads the full rates table and stores it
+        :return: True if the table was updated
+        """
+        # a failed attempt counts too, so errors can't use more of the quota than the interval allows
+        self.fetched_at = time.time()
+        res = await upstreams['fixer'].getjson(latest_url.format(self.access_key))
+        if not res.get("success"):
+            return False
+        self.fill(res["base"], res["rates"], res.get("timestamp", self.fetched_at), self.fetched_at)
+        await self.save()
+        return True
+
+    async def refresh_if_stale(self):
+        """
+        refreshes the table once it was fetched more than interval ago, cheap to call often
+        the publish timestamp isn't used, fixer publishes at its own pace and a table fetched late
+        would look stale again straight away
+        """
+        if time.time() - self.fetched_at >= self.interval:
+            await self.refresh()
@@ -1,13 +1,21 @@
-import motor.motor_asyncio as amotor
 from json import loads as l
 import asyncio
+from metrics import timed
 url=l(open("configs.json").read())['data']['url']
 class GuildDB:
     def __init__(self):
-        self.client=amotor.AsyncIOMotorClient(url)
-        self.db=self.client['Guildstore']
+        self.client=None
+        self._db=None
         self.collections=[]
         self.collection=""
+    @property
+    def db(self):
+        # motor is imported and connected on first use, not while the bot is starting
+        if self._db is None:
+            import motor.motor_asyncio as amotor
+            self.client=amotor.AsyncIOMotorClient(url)
+            self._db=self.client['Guildstore']
+        return self._db
     async def add_collection(self,name:str):
         self.collections+=[name]
         self.collections=list(set(self.collections))
@@ -20,16 +28,20 @@ class GuildDB:
     def set_collection(self,name:str):
         self.collection=name
     async def insert(self,**kwargs):
-        await self.db[self.collection].insert_one(kwargs)
+        with timed('db'):
+            await self.db[self.collection].insert_one(kwargs)
     async def insert_many(self,*items):
         for i in items:
             await self.insert(**i)
     async def delete(self,**kwargs):
-        await self.db[self.collection].delete_many(kwargs)
+        with timed('db'):
+            await self.db[self.collection].delete_many(kwargs)
     async def find(self,length=1000,**kwargs):
         cursor=self.db[self.collection].find(kwargs)
         res=[]
-        for doc in await cursor.to_list(length=length):
+        with timed('db'):
+            docs=await cursor.to_list(length=length)
+        for doc in docs:
             doc.setdefault("")
             res.append(doc)
         return res
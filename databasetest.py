@@ -1,5 +1,3 @@
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials as Setup
 from discord.ext import commands
 import time
 import datetime
@@ -11,17 +9,29 @@ import inspect
 import textwrap
 from contextlib import redirect_stdout
 import io
+import quantumutils as utils
 ownerid = 360022804357185537
 
+gspread = utils.lazy_import("gspread")
 scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
-creds = Setup.from_json_keyfile_name("quantumbase-ca2e03e56485.json",scope)
-client = gspread.authorize(creds)
-sheet = client.open("Dataspread").sheet1
+sheet = None
+
+def get_sheet():
+  '''authorizes and opens the spreadsheet the first time a command needs it'''
+  global sheet
+  if sheet is None:
+    from oauth2client.service_account import ServiceAccountCredentials as Setup
+    creds = Setup.from_json_keyfile_name("quantumbase-ca2e03e56485.json",scope)
+    sheet = gspread.authorize(creds).open("Dataspread").sheet1
+  return sheet
 
 class Database:
   def __init__(self,bot):
     self.bot=bot
-    self.sheet=sheet
+
+  @property
+  def sheet(self):
+    return get_sheet()
 
   @commands.command()
   @commands.cooldown(rate=1,per=8,type=commands.BucketType.guild)
@@ -0,0 +1,138 @@
+import asyncio
+import datetime
+import math
+import time
+import quantumutils as utils
+
+
+class EditRouter:
+    '''
+    routes message_edit events to the one handler registered for that message id
+    registrations expire through a timer wheel: every resolution seconds one slot is
+    swept, so cleanup cost is spread out and dispatch is a single dict lookup
+    '''
+
+    def __init__(self, resolution=30, horizon=1800):
+        self.resolution = resolution
+        self.slots = [set() for _ in range(math.ceil(horizon / resolution) + 1)]
+        self.handlers = {}
+        self.position = 0
+        self.timer = None
+        self.counters = {'events': 0, 'dispatched': 0, 'expired': 0}
+
+    def __len__(self):
+        return len(self.handlers)
+
+    def _slot(self, expires):
+        ahead = max(1, math.ceil((expires - time.monotonic()) / self.resolution))
+        return (self.position + min(ahead, len(self.slots) - 1)) % len(self.slots)
+
+    def register(self, message_id, handler, data=None, timeout=1800):
+        """
+        watches a message for edits, replacing any earlier handler for it
+        :param message_id: id of the message to watch
+        :param handler: coroutine function called as handler(data, before, after), returning whether it took the edit
+        :param data: passed back to the handler, so no per message closure is needed
+        :param timeout: seconds to keep watching
+        """
+        expires = time.monotonic() + timeout
+        self.handlers[message_id] = (handler, data, expires)
+        self.slots[self._slot(expires)].add(message_id)
+        if self.timer is None:
+            self.timer = asyncio.get_event_loop().call_later(self.resolution, self.tick)
+
+    def unregister(self, message_id):
+        self.handlers.pop(message_id, None)
+
+    def tick(self):
+        self.position = (self.position + 1) % len(self.slots)
+        due = self.slots[self.position]
+        self.slots[self.position] = set()
+        now = time.monotonic()
+        for message_id in due:
+            entry = self.handlers.get(message_id)
+            if entry is None:
+                continue
+            if entry[2] <= now:
+                del self.handlers[message_id]
+                self.counters['expired'] += 1
+            else:
+                # longer than the wheel's horizon, or re-registered: go round again
+                self.slots[self._slot(entry[2])].add(message_id)
+        if self.handlers:
+            self.timer = asyncio.get_event_loop().call_later(self.resolution, self.tick)
+        else:
+            self.timer = None
+
+    async def dispatch(self, before, after):
+        """
+        :return: whether the message's handler took the edit, False lets it run as a command as usual
+        """
+        self.counters['events'] += 1
+        entry = self.handlers.get(after.id)
+        if entry is None:
+            return False
+        handler, data, expires = entry
+        if expires <= time.monotonic():
+            self.unregister(after.id)
+            return False
+        self.counters['dispatched'] += 1
+        return bool(await handler(data, before, after))
+
+    def stats(self):
+        return dict(self.counters, watching=len(self.handlers))
+
+
+class EditFilter:
+    '''
+    decides which edits are worth running as commands again
+    the fingerprint of the text last dispatched for each recent message is kept, so edits that only add an
+    embed, pin the message or set the same text again are dropped before the prefix lookup and parsing
+    :param window: seconds after a message is sent that its edits are still re-run
+    '''
+
+    def __init__(self, window=300, maxsize=4096):
+        self.window = window
+        self.dispatched = utils.LRUCache(maxsize, ttl=window)
+        self.counters = {'edits': 0, 'unchanged': 0, 'stale': 0, 'repeated': 0, 'redispatched': 0}
+
+    @staticmethod
+    def fingerprint(message):
+        return hash(message.content.strip())
+
+    def seen(self, message):
+        """
+        records the text a new message was dispatched with
+        """
+        if not message.author.bot:
+            self.dispatched.set(message.id, self.fingerprint(message))
+
+    def should_dispatch(self, before, after):
+        self.counters['edits'] += 1
+        if after.author.bot or before.content == after.content:
+            self.counters['unchanged'] += 1
+            return False
+        if (datetime.datetime.utcnow() - after.created_at).total_seconds() > self.window:
+            self.counters['stale'] += 1
+            return False
+        fingerprint = self.fingerprint(after)
+        if self.dispatched.get(after.id) == fingerprint:
+            self.counters['repeated'] += 1
+            return False
+        self.dispatched.set(after.id, fingerprint)
+        self.counters['redispatched'] += 1
+        return True
+
+    def stats(self):
+        return dict(self.counters, tracked=len(self.dispatched))
+
+
+def get_router(bot) -> EditRouter:
+    """
+    gets the bot's edit router, creating it on first use
+    the bot's on_message_edit calls dispatch, and only re-runs the edit as a command when no handler took it
+    """
+    router = getattr(bot, 'edit_router', None)
+    if router is None:
+        router = bot.edit_router = EditRouter()
+    return router
@@ -0,0 +1,150 @@
+import collections
+import discord
+import quantumutils as utils
+from simplepaginator import page
+
+colour = discord.Colour.blurple()
+
+
+def trigrams(word):
+    padded = '  {} '.format(word.lower())
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class HelpIndex:
+    '''
+    the help pages for every cog and command, built once and kept until the loaded cogs or extensions change
+    names and aliases are also kept in a trigram index, so a mistyped name can be matched to the closest ones
+    '''
+
+    def __init__(self, bot, prefix='q!'):
+        self.bot = bot
+        self.prefix = prefix
+        self.stamp = None
+        self.names = {}
+        self.grams = {}
+        self.sizes = {}
+        self.bot_pages = []
+        self.cog_pages = {}
+        self.command_pages = {}
+        self.counters = {'builds': 0, 'lookups': 0, 'suggestions': 0}
+
+    def current_stamp(self):
+        return tuple(self.bot.extensions), tuple(self.bot.cogs), len(self.bot.all_commands)
+
+    def ensure(self):
+        if self.stamp != self.current_stamp():
+            self.build()
+
+    def invalidate(self):
+        self.stamp = None
+
+    def build(self):
+        """
+        compiles the pages and the name index from the bot's current cogs and commands
+        """
+        self.stamp = self.current_stamp()
+        self.counters['builds'] += 1
+        self.names.clear()
+        self.grams.clear()
+        self.sizes.clear()
+        self.cog_pages.clear()
+        self.command_pages.clear()
+
+        listing = collections.defaultdict(list)
+        for command in sorted(self.bot.walk_commands(), key=lambda c: c.qualified_name):
+            if command.hidden:
+                continue
+            name = command.qualified_name
+            listing[command.cog_name or 'No Category'].append(
+                '`{}{}` - {}'.format(self.prefix, name, command.short_doc or 'No help given'))
+            self.command_pages[name] = [self.command_page(command)]
+            for key in [name, *command.aliases]:
+                if command.parent is not None and key != name:
+                    key = '{} {}'.format(command.parent.qualified_name, key)
+                self.add_name(key, ('command', name))
+
+        for cog_name in sorted(listing):
+            cog = self.bot.get_cog(cog_name)
+            doc = (cog.__doc__ or '').strip() if cog is not None else ''
+            self.cog_pages[cog_name] = self.listing_pages(cog_name, doc, listing[cog_name])
+            if cog is not None:
+                self.add_name(cog_name, ('cog', cog_name))
+
+        footer = 'Type {}help <command or category> for more'.format(self.prefix)
+        self.bot_pages = [page(title="{}'s commands".format(self.bot.user.name if self.bot.user else 'Bot'),
+                               description=self.bot.description, colour=colour, footer=footer)]
+        for cog_name in sorted(listing):
+            self.bot_pages += self.cog_pages[cog_name]
+
+    def add_name(self, key, target):
+        key = key.lower()
+        self.names[key] = target
+        grams = trigrams(key)
+        self.sizes[key] = len(grams)
+        for gram in grams:
+            self.grams.setdefault(gram, set()).add(key)
+
+    def listing_pages(self, cog_name, doc, lines):
+        text = '\n'.join(([doc, ''] if doc else []) + lines)
+        parts = list(utils.chunks(text))
+        return [page(title=cog_name if len(parts) == 1 else '{} ({}/{})'.format(cog_name, i, len(parts)),
+                     description=part, colour=colour) for i, part in enumerate(parts, 1)]
+
+    def command_page(self, command):
+        text = command.help or 'No help given'
+        if command.aliases:
+            text += '\n\nAliases: ' + ', '.join(command.aliases)
+        return page(title='{}{} {}'.format(self.prefix, command.qualified_name, command.signature).strip(),
+                    description=next(utils.chunks(text)), colour=colour)
+
+    def lookup(self, name=None):
+        """
+        finds the pages for the whole bot, a cog or a command
+        :param name: cog or command name, aliases work too. None for the whole bot
+        :return: a list of page factories, None if nothing is called that
+        """
+        self.ensure()
+        self.counters['lookups'] += 1
+        if name is None:
+            return self.bot_pages
+        target = self.names.get(' '.join(name.lower().split()))
+        if target is None:
+            return None
+        kind, key = target
+        return self.cog_pages[key] if kind == 'cog' else self.command_pages[key]
+
+    def suggest(self, name, limit=3, cutoff=0.3):
+        """
+        the closest names to a mistyped one, scored by the trigrams they share
+        :param name: what was typed
+        :param limit: most suggestions to return
+        :param cutoff: lowest Dice coefficient counted as a match
+        :return: a list of names, best first
+        """
+        self.ensure()
+        self.counters['suggestions'] += 1
+        wanted = trigrams(name)
+        shared = collections.Counter()
+        for gram in wanted:
+            shared.update(self.grams.get(gram, ()))
+        scored = []
+        for key, common in shared.items():
+            score = 2 * common / (len(wanted) + self.sizes[key])
+            if score >= cutoff:
+                scored.append((score, key))
+        scored.sort(key=lambda s: (-s[0], s[1]))
+        return [key for score, key in scored[:limit]]
+
+    def stats(self):
+        return dict(self.counters, names=len(self.names), trigrams=len(self.grams))
+
+
+def get_help_index(bot, prefix='q!') -> HelpIndex:
+    """
+    gets the bot's help index, creating it on first use
+    """
+    index = getattr(bot, 'help_index', None)
+    if index is None:
+        index = bot.help_index = HelpIndex(bot, prefix)
+    return index
@@ -1,12 +1,22 @@
 """
-Formats and makes use of the code-cogs equation editor API to generate
-previews for LaTeX strings.
+Formats and makes use of the code-cogs equation editor API, or renders
+locally with matplotlib's mathtext, to generate previews for LaTeX strings.
 """
+import asyncio                       # Event loop
+import concurrent.futures            # Process pool for padding
+import functools                     # partial
+import hashlib                       # Cache keys
+import importlib.util                # Optional matplotlib
 import io                            # BytesIO
+import json                          # Deployment config
+import os                            # Disk cache directory
+import re                            # Whitespace normalisation
 import discord                       # Discord.py
 import PIL.Image                     # PIL Image loading
 import PIL.ImageDraw                 # PIL Image drawing
 from neko2.shared import traits, commands  # IOBound, CpuBound, and HTTP pools.
+import quantumutils as utils         # LRUCache
+from editrouter import get_router    # Edit dispatch
 
 # URL endpoint to use.
 end_point = 'http://latex.codecogs.com/'
@@ -47,8 +57,347 @@ padding_pct_height = 1.5  # %/100
 padding_pct_width = 1.15  # %/100
 padding_min_width = 100   # pixels
 
+# Renderer used by this deployment: 'local' renders with matplotlib's
+# mathtext in a worker process, falling back to codecogs for anything it
+# cannot draw; 'remote' always uses codecogs.
+try:
+    with open('configs.json') as fp:
+        renderer_name = json.loads(fp.read()).get('latex', {}).get('renderer', 'remote')
+except (OSError, ValueError):
+    renderer_name = 'remote'
+
+# mathtext fontsets standing in for the codecogs fonts.
+local_fonts = {
+    'Latin Modern': 'cm',
+    'Computer Modern': 'cm',
+    'Verdana': 'dejavusans',
+    'Comic Sans': 'dejavusans',
+    'Helvetica': 'stixsans'
+}
+
+# Constructs mathtext has no support for; these go to the remote renderer.
+local_unsupported = re.compile(
+    r'\\\\|\\(begin|end|usepackage|documentclass|newcommand|def|text|tag|label)\b')
+
+# Options generate_url falls back to, so cache keys always cover every option.
+default_options = {
+    'engine': 'png',
+    'size': 12,
+    'font': 'Latin Modern',
+    'bg_colour': 'transparent',
+    'fg_colour': 'white',
+    'dpi': 200
+}
+
+cache_dir = 'Extras/latex-cache'
+cache_memory_items = 256
+cache_disk_bytes = 64 * 1024 * 1024
+
+
+class RenderCache:
+    """
+    Two-tier cache of finished, padded PNG renders. The first tier is an
+    in-memory LRU; the second is a directory on disk that is trimmed back to
+    ``max_bytes`` by evicting the least recently used files. Entries are
+    addressed by a hash of the normalised LaTeX and every render option, so
+    the same formula rendered the same way is only ever downloaded and padded
+    once.
+    """
+    def __init__(self,
+                 path: str = cache_dir,
+                 max_items: int = cache_memory_items,
+                 max_bytes: int = cache_disk_bytes):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory = utils.LRUCache(maxsize=max_items)
+        self.disk_bytes = None
+        self.disk_hits = 0
+
+    @staticmethod
+    def key(content: str, padding_colour: tuple, **options) -> str:
+        """
+        Builds the cache key. Runs of whitespace are collapsed first, as
+        generate_url renders spaces and newlines identically anyway.
+        """
+        content = re.sub(r'\s+', ' ', content.strip())
+        options = {**default_options, **options}
+        raw = '\0'.join([content, repr(padding_colour)] +
+                        [f'{k}={options[k]}' for k in sorted(options)])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, f'{key}.png')
+
+    def get(self, key: str):
+        """Memory tier only; never blocks."""
+        return self.memory.get(key)
+
+    def load(self, key: str):
+        """
+        Disk tier. Blocking, so run it in an IO worker. Reading a file bumps
+        its modification time so that trimming evicts it last. The memory
+        tier is left alone, it is only ever touched from the event loop.
+        """
+        try:
+            with open(self._file(key), 'rb') as fp:
+                data = fp.read()
+            os.utime(self._file(key))
+        except OSError:
+            return None
+        return data
+
+    def store(self, key: str, data: bytes):
+        """
+        Adds a render to the disk tier, trimming it if it has grown past its
+        budget. Blocking, so run it in an IO worker.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        tmp = self._file(key) + '.tmp'
+        try:
+            with open(tmp, 'wb') as fp:
+                fp.write(data)
+            os.replace(tmp, self._file(key))
+        except OSError:
+            # Don't leave a half written file behind when the disk is full.
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+        if self.disk_bytes is None:
+            self.disk_bytes = sum(s.st_size for _, s in self._entries())
+        else:
+            self.disk_bytes += len(data)
+
+        if self.disk_bytes > self.max_bytes:
+            self.trim()
+
+    def _entries(self):
+        """
+        (entry, stat) for every file in the disk tier, skipping files that a
+        concurrent store or trim renamed or removed while scanning.
+        """
+        for entry in os.scandir(self.path):
+            try:
+                yield entry, entry.stat()
+            except OSError:
+                pass
+
+    def trim(self):
+        entries = sorted(self._entries(), key=lambda item: item[1].st_mtime)
+        total = sum(s.st_size for _, s in entries)
+        # Drop to 90% so a full cache does not rescan the directory on every
+        # single store.
+        while entries and total > self.max_bytes * 0.9:
+            entry, stat = entries.pop(0)
+            total -= stat.st_size
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        self.disk_bytes = total
+
+
+def pad_png(in_img: bytes, bg_colour: tuple) -> bytes:
+    """
+    Adds a padded border around the edge of the image. We do this as the
+    default rendered LaTeX has no border, and on a contrasting background
+    this can look awkward and is harder to read. This assumes both the input
+    and output are to be PNG format.
+
+    This lives at module level and deals only in bytes so it can be sent to
+    a worker process. Images with no transparent pixels skip the alpha
+    compositing entirely and are pasted straight onto the background.
+    """
+    with io.BytesIO(in_img) as in_data:
+        old_img: PIL.Image.Image = PIL.Image.open(in_data)
+        old_img.load()
+
+    new_w = int(old_img.width * padding_pct_width)
+    new_w = max(new_w, padding_min_width)
+    new_h = int(old_img.height * padding_pct_height)
+
+    new_x = int((new_w - old_img.width) / 2)
+    new_y = int((new_h - old_img.height) / 2)
+
+    non_transparent = PIL.Image.new(
+        'RGBA',
+        (new_w, new_h),
+        bg_colour
+    )
+
+    has_alpha = (old_img.mode in ('RGBA', 'LA', 'PA')
+                 or 'transparency' in old_img.info)
+
+    if has_alpha:
+        old_img = old_img.convert('RGBA')
+        has_alpha = old_img.getextrema()[3][0] < 0xFF
+
+    if not has_alpha:
+        # Opaque: nothing to blend, a plain paste is enough.
+        non_transparent.paste(old_img, (new_x, new_y))
+        new_img = non_transparent
+    else:
+        new_img = PIL.Image.new(
+            'RGBA',
+            (new_w, new_h),
+            (0x0, 0x0, 0x0, 0x0)
+        )
+
+        new_img.paste(
+            old_img,
+            (new_x, new_y),
+        )
+
+        new_img = PIL.Image.alpha_composite(non_transparent, new_img)
+
+    with io.BytesIO() as out_data:
+        new_img.save(out_data, 'PNG')
+        return out_data.getvalue()
+
+
+def mathtext_png(content: str,
+                 size: int,
+                 font: str,
+                 bg_colour: str,
+                 fg_colour: str,
+                 dpi: int) -> bytes:
+    """
+    Renders the content with matplotlib's mathtext and returns PNG bytes.
+    Runs in a worker process; matplotlib is imported there, so the bot
+    itself never pays for it. Raises ValueError for anything mathtext
+    cannot parse.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    if '$' not in content:
+        content = f'${content}$'
+
+    transparent = bg_colour == 'transparent'
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    fig.text(0, 0, content,
+             fontsize=size,
+             color=fg_colour,
+             math_fontfamily=local_fonts[font])
+
+    with io.BytesIO() as out_data:
+        fig.savefig(out_data,
+                    format='png',
+                    dpi=dpi,
+                    bbox_inches='tight',
+                    pad_inches=0.02,
+                    transparent=transparent,
+                    facecolor='none' if transparent else bg_colour)
+        return out_data.getvalue()
+
+
+class UnsupportedContent(Exception):
+    """Raised by a renderer that cannot draw the given content."""
+
+
+class Renderer:
+    """
+    Turns LaTeX into unpadded PNG bytes. Subclasses implement render; the
+    options are the same keyword arguments generate_url takes.
+    """
+    name = None
+
+    async def render(self, cog, bot, content: str, **options) -> bytes:
+        raise NotImplementedError
+
+
+class RemoteRenderer(Renderer):
+    """Renders through the codecogs equation editor API."""
+    name = 'remote'
+
+    async def render(self, cog, bot, content: str, **options) -> bytes:
+        # Append a tex newline to the start to force the content to
+        # left-align.
+        url = cog.generate_url(f'\\\\{content}', **options)
+
+        conn = await cog.acquire_http(bot)
+
+        resp = await conn.get(url)
+        return await resp.read()
+
+
+class LocalRenderer(Renderer):
+    """
+    Renders with matplotlib's mathtext in the process pool, handing
+    anything mathtext does not understand to the fallback renderer.
+    """
+    name = 'local'
+
+    def __init__(self, fallback: Renderer = None):
+        self.fallback = fallback or RemoteRenderer()
+
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec('matplotlib') is not None
+
+    async def render(self, cog, bot, content: str, **options) -> bytes:
+        local = {**default_options, **options}
+        try:
+            if local.pop('engine') != 'png' or local_unsupported.search(content):
+                raise UnsupportedContent(content)
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(
+                get_process_pool(),
+                functools.partial(mathtext_png, content, **local))
+        except (UnsupportedContent, ValueError):
+            return await self.fallback.render(cog, bot, content, **options)
+
+
+renderers = {
+    'remote': RemoteRenderer,
+    'local': LocalRenderer
+}
+
+
+def get_renderer(name: str = renderer_name) -> Renderer:
+    """
+    Picks the renderer named in the deployment config, using the remote one
+    when the local one is asked for but matplotlib is not installed.
+    """
+    if name == 'local' and not LocalRenderer.available():
+        name = 'remote'
+    return renderers[name]()
+
+
+_process_pool = None
+
+
+def get_process_pool() -> concurrent.futures.ProcessPoolExecutor:
+    """
+    Lazily starts the process pool used for padding and local rendering,
+    one worker per core.
+    """
+    global _process_pool
+    if _process_pool is None:
+        _process_pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=os.cpu_count() or 1)
+    return _process_pool
+
+
+def shutdown_process_pool():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False)
+        _process_pool = None
+
 
 class LatexCog(traits.CogTraits):
+    render_cache = RenderCache()
+    renderer = get_renderer()
+
+    def __unload(self):
+        shutdown_process_pool()
+
     @staticmethod
     def generate_url(content,
                      *,
@@ -112,71 +461,53 @@ class LatexCog(traits.CogTraits):
     @classmethod
     async def pad_convert_image(cls,
                                 bot,
-                                in_img: io.BytesIO,
-                                out_img: io.BytesIO,
-                                bg_colour: tuple):
+                                in_img: bytes,
+                                bg_colour: tuple) -> bytes:
         """
-        Takes input image bytes and constructs the image in memory in a
-        CPU worker. We then add a padded border around the edge of the image
-        and stream it back into the given output bytes IO object. We do this
-        as the default rendered LaTeX has no border, and on a contrasting
-        background this can look awkward and is harder to read.
-        This assumes both the input and output are to be PNG format.
-        EDIT: this has to be done on a Thread, not a Process. We cannot pickle
-        BytesIO objects.
+        Takes input PNG bytes and pads them in the shared process pool,
+        returning the padded PNG bytes. Plain bytes pickle cheaply, so the
+        PIL work runs in another process instead of fighting the event
+        loop for the GIL on an IO thread.
         """
-        def cpu_work():
-            old_img: PIL.Image.Image = PIL.Image.open(in_img)
-
-            new_w = int(old_img.width * padding_pct_width)
-            new_w = max(new_w, padding_min_width)
-            new_h = int(old_img.height * padding_pct_height)
-
-            new_x = int((new_w - old_img.width) / 2)
-            new_y = int((new_h - old_img.height) / 2)
-
-            new_img = PIL.Image.new(
-                'RGBA',
-                (new_w, new_h),
-                (0x0, 0x0, 0x0, 0x0)
-            )
-
-            new_img.paste(
-                old_img,
-                (new_x, new_y),
-            )
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(get_process_pool(), pad_png, in_img, bg_colour)
 
-            non_transparent = PIL.Image.new(
-                'RGBA',
-                (new_w, new_h),
-                bg_colour
-            )
-
-            new_img = PIL.Image.alpha_composite(non_transparent, new_img)
-
-            new_img.save(out_img, 'PNG')
-
-        await cls.run_in_io_executor(bot, cpu_work)
+    async def render(self, bot, content: str) -> bytes:
+        """
+        Produces the final padded PNG for the given content, going to the
+        renderer and PIL only when neither cache tier has it already.
+        """
+        options = {'size': 10}
+        padding_colour = (0x36, 0x39, 0x3E)
+        cache = self.render_cache
+
+        key = cache.key(content, padding_colour,
+                        renderer=self.renderer.name, **options)
+        data = cache.get(key)
+        if data is None:
+            data = await self.run_in_io_executor(bot, cache.load, key)
+            if data is not None:
+                cache.disk_hits += 1
+                cache.memory.set(key, data)
+        if data is not None:
+            return data
+
+        data = await self.renderer.render(self, bot, content, **options)
+        data = await self.pad_convert_image(bot, data, padding_colour)
+
+        # The cache is best-effort: a full or read-only disk must not fail a
+        # render that already succeeded.
+        cache.memory.set(key, data)
+        try:
+            await self.run_in_io_executor(bot, cache.store, key, data)
+        except OSError:
+            pass
+        return data
 
     async def get_send_image(self, ctx, content: str) -> discord.Message:
-        # Append a tex newline to the start to force the content to
-        # left-align.
-        url = self.generate_url(f'\\\\{content}', size=10)
-
-        conn = await self.acquire_http(ctx.bot)
+        data = await self.render(ctx.bot, content)
 
-        resp = await conn.get(url)
-        data = await resp.read()
-
-        with io.BytesIO(data) as in_data, io.BytesIO() as out_data:
-            in_data.seek(0)
-            await self.pad_convert_image(
-                ctx.bot,
-                in_data,
-                out_data,
-                (0x36, 0x39, 0x3E))
-
-            out_data.seek(0)
+        with io.BytesIO(data) as out_data:
             file = discord.File(out_data, 'latex.png')
 
             msg = await ctx.send(
@@ -185,28 +516,43 @@ class LatexCog(traits.CogTraits):
 
             return msg
 
-    # noinspection PyMethodMayBeStatic
-    def mk_edit_predicate(self, ctx: commands.Context):
+    @staticmethod
+    def is_reinvocation(prefix: str,
+                        names,
+                        after: discord.Message) -> bool:
         """
-        Generates a predicate for listening to edit events.
+        Decides whether an edited message still invokes this command.
         Note. This will only work if the prefix is the same, otherwise it will
-        return false when called.
+        return false.
         """
-        def predicate(before: discord.Message, after: discord.Message) -> bool:
-            assert before.id == after.id
-            assert before.channel == after.channel
-
-            # Get the command prefix
-            if not after.content.startswith(ctx.prefix):
-                return False
-            else:
-                content = after.content[len(ctx.prefix):].lstrip()
+        if not after.content.startswith(prefix):
+            return False
+        content = after.content[len(prefix):].lstrip()
+        return any(content.startswith(a) for a in names)
+
+    async def on_source_edit(self,
+                             watch: tuple,
+                             before: discord.Message,
+                             after: discord.Message):
+        """
+        Called by the edit router when the message that produced a render is
+        edited. The old render is removed and the command runs again on the
+        new content, which registers a fresh watch for the same message.
+        Edits into anything else are left to run as ordinary commands.
+        """
+        bot, prefix, names, msg = watch
+        if not self.is_reinvocation(prefix, names, after):
+            return False
 
-                assert hasattr(ctx.command, 'qualified_names')
-                return any(content.startswith(a)
-                           for a in ctx.command.qualified_names)
+        get_router(bot).unregister(after.id)
+        try:
+            await msg.delete()
+        except discord.HTTPException:
+            pass
 
-        return predicate
+        ctx = await bot.get_context(after)
+        await bot.invoke(ctx)
+        return True
 
     @commands.command(
         name='tex', aliases=['latex', 'texd', 'latexd'],
@@ -227,7 +573,12 @@ class LatexCog(traits.CogTraits):
             msg = await self.get_send_image(ctx, content)
 
         if not delete:
-            await commands.wait_for_edit(ctx=ctx, msg=msg, timeout=1800)
+            assert hasattr(ctx.command, 'qualified_names')
+            get_router(ctx.bot).register(
+                ctx.message.id,
+                self.on_source_edit,
+                (ctx.bot, ctx.prefix, ctx.command.qualified_names, msg),
+                timeout=1800)
 
 
 def setup(bot):
@@ -0,0 +1,105 @@
+"""
+Runs the bot as several cluster processes, each an AutoShardedBot owning a slice of the shards,
+with the shared state server they all talk to.
+
+    python launcher.py [--clusters N] [--shards M]
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+
+import aiohttp
+
+from sharedstate import StateServer
+
+root = os.path.dirname(os.path.abspath(__file__))
+info = json.loads(open(os.path.join(root, "configs.json")).read())
+gateway_url = "https://discordapp.com/api/v7/gateway/bot"
+identify_delay = 5.5  # Discord allows one IDENTIFY every 5 seconds
+
+
+async def recommended_shards(token):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(gateway_url, headers={"Authorization": "Bot " + token}) as response:
+            response.raise_for_status()
+            return (await response.json())["shards"]
+
+
+def clusters_for(shards, clusters):
+    """
+    :return: a list of shard id lists, one per cluster
+    """
+    return [list(range(shards))[i::clusters] for i in range(min(clusters, shards))]
+
+
+class Cluster:
+    '''
+    one bot process, restarted with a growing delay whenever it exits on its own
+    '''
+
+    def __init__(self, number, shard_ids, shard_count, state, delay):
+        self.number = number
+        self.env = dict(os.environ, QUANTUM_CLUSTER=str(number), QUANTUM_SHARDS=",".join(map(str, shard_ids)),
+                        QUANTUM_SHARD_COUNT=str(shard_count), QUANTUM_STATE=state)
+        self.delay = delay
+        self.process = None
+        self.restarts = 0
+        self.stopping = False
+
+    async def run(self):
+        await asyncio.sleep(self.delay)
+        backoff = 5
+        while not self.stopping:
+            self.process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(root, "code.py"),
+                                                                cwd=root, env=self.env)
+            code = await self.process.wait()
+            if self.stopping:
+                break
+            self.restarts += 1
+            print("cluster {} exited with {}, restarting in {}s".format(self.number, code, backoff))
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 300)
+
+    def stop(self):
+        self.stopping = True
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+
+async def main(opts):
+    config = info.get("sharding", {})
+    shards = opts.shards or config.get("shards") or await recommended_shards(info["bot"]["token"])
+    count = opts.clusters or config.get("clusters") or os.cpu_count() or 1
+    server = StateServer(config.get("state", "127.0.0.1:8765"))
+    await server.start()
+
+    clusters = []
+    started = 0
+    for number, shard_ids in enumerate(clusters_for(shards, count)):
+        # every cluster identifies its shards one by one, so later clusters wait for the earlier ones
+        clusters.append(Cluster(number, shard_ids, shards, server.address, started * identify_delay))
+        started += len(shard_ids)
+    print("{} shards over {} clusters".format(shards, len(clusters)))
+
+    loop = asyncio.get_event_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, lambda: [cluster.stop() for cluster in clusters])
+        except NotImplementedError:
+            pass
+    try:
+        await asyncio.gather(*(cluster.run() for cluster in clusters))
+    finally:
+        for cluster in clusters:
+            cluster.stop()
+        server.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-c", "--clusters", type=int, help="processes to run, the number of cores by default")
+    parser.add_argument("-s", "--shards", type=int, help="total shards, Discord's recommendation by default")
+    asyncio.get_event_loop().run_until_complete(main(parser.parse_args()))
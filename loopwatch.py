@@ -0,0 +1,102 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from metrics import Histogram
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+
+class LagMonitor:
+    '''
+    measures how late the event loop wakes up, and when it is stalled for longer than threshold a helper
+    thread samples the loop thread's stack, so the blocking call and the command that made it can be ranked
+    :param running: maps each task running a command to the command's name
+    :param interval: seconds between the loop's heartbeats
+    :param threshold: seconds of lag counted as a stall
+    '''
+
+    def __init__(self, running, interval=0.1, threshold=0.25):
+        self.running = running
+        self.interval = interval
+        self.threshold = threshold
+        self.lag = Histogram()
+        self.beat = time.monotonic()
+        self.pending = None
+        self.blockers = {}
+        self.stalls = 0
+        self.loop = None
+        self.thread_id = None
+        self.task = None
+        self.thread = None
+        self.on_stall = None
+
+    async def heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            self.beat = expected
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - expected
+            self.lag.observe(lag * 1000)
+            if lag >= self.threshold:
+                self.record(lag)
+
+    def record(self, lag):
+        sample, self.pending = self.pending, None
+        self.stalls += 1
+        command, where, stack = sample or ('unknown', 'not sampled', '')
+        entry = self.blockers.setdefault((command, where), {'count': 0, 'total': 0.0, 'max': 0.0, 'stack': stack})
+        entry['count'] += 1
+        entry['total'] += lag * 1000
+        entry['max'] = max(entry['max'], lag * 1000)
+        if self.on_stall is not None:
+            self.on_stall(command=command, where=where, lag_ms=round(lag * 1000, 2))
+
+    def sample(self):
+        """
+        runs on the helper thread: takes the loop thread's stack and the command of its running task
+        """
+        frame = sys._current_frames().get(self.thread_id)
+        if frame is None:
+            return
+        stack = traceback.extract_stack(frame)
+        # blame the innermost frame in the bot's own code, that is where the blocking call was made
+        ours = [f for f in stack if f.filename.startswith(root) and f.filename != __file__]
+        culprit = (ours or stack)[-1]
+        task = asyncio.current_task(self.loop)
+        command = self.running.get(task, 'no command' if task is not None else 'loop callback')
+        where = '{}:{} in {}'.format(os.path.basename(culprit.filename), culprit.lineno, culprit.name)
+        self.pending = (command, where, ''.join(traceback.format_list(stack[-8:])))
+
+    def watch(self):
+        sampled = None
+        while True:
+            time.sleep(self.threshold / 2)
+            beat = self.beat
+            if time.monotonic() - beat > self.threshold and sampled != beat:
+                sampled = beat
+                try:
+                    self.sample()
+                except Exception:
+                    pass
+
+    def start(self, loop):
+        """
+        starts the heartbeat and the helper thread, must be called from the loop's thread
+        """
+        if self.task is None or self.task.done():
+            self.loop = loop
+            self.thread_id = threading.get_ident()
+            self.task = loop.create_task(self.heartbeat())
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.watch, name='loop-watchdog', daemon=True)
+            self.thread.start()
+        return self.task
+
+    def ranking(self, limit=10):
+        """
+        :return: the worst blockers as ((command, where), entry) pairs, most total stall time first
+        """
+        return sorted(self.blockers.items(), key=lambda item: -item[1]['total'])[:limit]
@@ -0,0 +1,208 @@
+import asyncio
+import bisect
+import contextvars
+import os
+import time
+
+# upper bounds of the latency buckets, in milliseconds
+bounds = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+phases = ('total', 'db', 'http', 'discord')
+
+# the phase times of the command running in the current task, None outside of commands
+current = contextvars.ContextVar('command_phases', default=None)
+
+
+class Histogram:
+    '''
+    a fixed bucket latency histogram, cheap to update and small enough to keep per command and phase
+    '''
+    __slots__ = ('counts', 'count', 'sum', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, ms):
+        self.counts[bisect.bisect_left(bounds, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, pct):
+        """
+        estimates a percentile by interpolating inside the bucket it falls in
+        :param pct: 0 to 100
+        :return: milliseconds, 0 when nothing was observed
+        """
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lower = bounds[i - 1] if i else 0.0
+                upper = min(bounds[i], self.max) if i < len(bounds) else self.max
+                return lower + (upper - lower) * (rank - seen) / n
+            seen += n
+        return self.max
+
+
+class timed:
+    '''
+    adds the time spent inside the with block to a phase of the running command
+    '''
+    __slots__ = ('phase', 'start')
+
+    def __init__(self, phase):
+        self.phase = phase
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        spent = current.get()
+        if spent is not None:
+            spent[self.phase] = spent.get(self.phase, 0.0) + (time.perf_counter() - self.start) * 1000
+        return False
+
+
+class Metrics:
+    '''
+    per command latency histograms, split into the time spent on the database, other
+    HTTP services and Discord itself, fed by the bot's before and after invoke hooks
+    '''
+
+    def __init__(self, path="Extras/metrics.prom", interval=30, port=None):
+        self.path = path
+        self.interval = interval
+        self.port = port
+        self.commands = {}
+        self.errors = {}
+        self.running = {}
+        self.cluster = None
+        self.shard_messages = {}
+        self.latencies = None
+        self.task = None
+        self.server = None
+
+    def histogram(self, command, phase):
+        table = self.commands.setdefault(command, {})
+        if phase not in table:
+            table[phase] = Histogram()
+        return table[phase]
+
+    async def before(self, ctx):
+        ctx.metrics_started = time.perf_counter()
+        current.set({})
+        self.running[asyncio.current_task()] = ctx.command.qualified_name
+
+    async def after(self, ctx):
+        self.running.pop(asyncio.current_task(), None)
+        started = getattr(ctx, 'metrics_started', None)
+        spent = current.get()
+        if started is None or spent is None:
+            return
+        command = ctx.command.qualified_name
+        self.histogram(command, 'total').observe((time.perf_counter() - started) * 1000)
+        for phase, ms in spent.items():
+            self.histogram(command, phase).observe(ms)
+        if getattr(ctx, 'command_failed', False):
+            self.errors[command] = self.errors.get(command, 0) + 1
+        current.set(None)
+
+    def shard_event(self, shard_id):
+        self.shard_messages[shard_id] = self.shard_messages.get(shard_id, 0) + 1
+
+    def install(self, bot):
+        """
+        hooks into every command invocation and times each request sent to Discord
+        """
+        bot.before_invoke(self.before)
+        bot.after_invoke(self.after)
+        request = bot.http.request
+
+        async def timed_request(*args, **kwargs):
+            with timed('discord'):
+                return await request(*args, **kwargs)
+        bot.http.request = timed_request
+
+    def summary(self, phase='total'):
+        """
+        :return: (command, count, p50, p95, p99) for each command, slowest p95 first
+        """
+        rows = []
+        for command, table in self.commands.items():
+            hist = table.get(phase)
+            if hist is not None and hist.count:
+                rows.append((command, hist.count, hist.percentile(50), hist.percentile(95), hist.percentile(99)))
+        rows.sort(key=lambda row: -row[3])
+        return rows
+
+    def render(self):
+        """
+        the histograms in the Prometheus text exposition format, in seconds as Prometheus expects
+        """
+        lines = ['# HELP quantum_command_duration_seconds Time spent running a command, by phase',
+                 '# TYPE quantum_command_duration_seconds histogram']
+        for command, table in sorted(self.commands.items()):
+            for phase, hist in sorted(table.items()):
+                labels = 'command="{}",phase="{}"'.format(command, phase)
+                total = 0
+                for bound, n in zip(bounds, hist.counts):
+                    total += n
+                    lines.append('quantum_command_duration_seconds_bucket{{{},le="{}"}} {}'.format(
+                        labels, bound / 1000, total))
+                lines.append('quantum_command_duration_seconds_bucket{{{},le="+Inf"}} {}'.format(labels, hist.count))
+                lines.append('quantum_command_duration_seconds_sum{{{}}} {}'.format(labels, hist.sum / 1000))
+                lines.append('quantum_command_duration_seconds_count{{{}}} {}'.format(labels, hist.count))
+        lines += ['# HELP quantum_command_errors_total Commands that raised an error',
+                  '# TYPE quantum_command_errors_total counter']
+        lines += ['quantum_command_errors_total{{command="{}"}} {}'.format(command, n)
+                  for command, n in sorted(self.errors.items())]
+        cluster = '' if self.cluster is None else 'cluster="{}",'.format(self.cluster)
+        lines += ['# HELP quantum_shard_messages_total Messages received, by shard',
+                  '# TYPE quantum_shard_messages_total counter']
+        lines += ['quantum_shard_messages_total{{{}shard="{}"}} {}'.format(cluster, shard, n)
+                  for shard, n in sorted(self.shard_messages.items())]
+        if self.latencies is not None:
+            lines += ['# HELP quantum_shard_latency_seconds Gateway heartbeat latency, by shard',
+                      '# TYPE quantum_shard_latency_seconds gauge']
+            lines += ['quantum_shard_latency_seconds{{{}shard="{}"}} {}'.format(cluster, shard, latency)
+                      for shard, latency in self.latencies()]
+        return '\n'.join(lines) + '\n'
+
+    def write(self, text):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            f.write(text)
+        os.replace(tmp, self.path)
+
+    async def export(self):
+        """
+        writes the metrics file off the event loop, meant to run every interval seconds
+        """
+        await asyncio.get_event_loop().run_in_executor(None, self.write, self.render())
+
+    async def serve(self):
+        from aiohttp import web
+
+        async def handler(request):
+            return web.Response(text=self.render(), content_type='text/plain', charset='utf-8')
+
+        app = web.Application()
+        app.router.add_get('/metrics', handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        self.server = web.TCPSite(runner, '127.0.0.1', self.port)
+        await self.server.start()
+
+    def start(self, loop):
+        """
+        serves /metrics on localhost when a port is set
+        """
+        if self.port and (self.task is None or self.task.done()):
+            self.task = loop.create_task(self.serve())
+        return self.task
@@ -0,0 +1,97 @@
+import codecs
+import html
+import re
+import urllib.parse
+import aiohttp
+import quantumutils as utils
+
+search_url = "https://pypi.org/search/?"
+
+cache = utils.LRUCache(maxsize=256, ttl=1800)
+
+
+class SearchParser:
+    '''
+    single pass extractor for the PyPI search results page
+    text is fed in chunks, snippets are located with str.find and matched once with a
+    precompiled pattern, only the unfinished tail of the page is kept between chunks
+    '''
+    marker = '<a class="package-snippet"'
+    snippet = re.compile(marker + r'[^>]*>.*?'
+                         r'<span class="package-snippet__name">(?P<name>[^<]*)</span>\s*'
+                         r'<span class="package-snippet__version">(?P<version>[^<]*)</span>.*?'
+                         r'<p class="package-snippet__description">(?P<description>[^<]*)</p>', re.S)
+
+    def __init__(self, limit=20):
+        self.limit = limit
+        self.results = []
+        self.buffer = ''
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return
+        buf = self.buffer + text
+        start = buf.find(self.marker)
+        while start != -1:
+            match = self.snippet.match(buf, start)
+            if match is None:
+                break
+            self.results.append(tuple(html.unescape(i).strip() for i in match.group('name', 'version', 'description')))
+            if len(self.results) >= self.limit:
+                self.done = True
+                self.buffer = ''
+                return
+            start = buf.find(self.marker, match.end())
+        self.buffer = buf[start:] if start != -1 else buf[-len(self.marker):]
+
+    def close(self):
+        self.buffer = ''
+
+
+def parse(pages, limit=20):
+    """
+    parses an iterable of text chunks
+    :param pages: the chunks of the search page
+    :param limit: maximum number of results
+    :return: a list of (name, version, description) tuples
+    """
+    parser = SearchParser(limit)
+    for chunk in pages:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.results
+
+
+async def search(query, limit=20, chunk=8192):
+    """
+    searches PyPI, reading the page in chunks and stopping after limit results
+    :param query: the text to search
+    :param limit: maximum number of results
+    :param chunk: size in bytes of each read
+    :return: a list of (name, version, description) tuples
+    :raise aiohttp.ClientResponseError: when PyPI does not answer with the results page
+    """
+    key = (query.lower(), limit)
+    res = cache.get(key)
+    if res is not None:
+        return res
+    parser = SearchParser(limit)
+    decoder = codecs.getincrementaldecoder('utf8')(errors='replace')
+    async with aiohttp.ClientSession() as session:
+        async with session.get(search_url + urllib.parse.urlencode({"q": query})) as response:
+            response.raise_for_status()
+            async for data in response.content.iter_chunked(chunk):
+                parser.feed(decoder.decode(data))
+                if parser.done:
+                    break
+            else:
+                parser.feed(decoder.decode(b'', final=True))
+                parser.close()
+    # no results can also mean a page whose layout the parser no longer matches, so it is fetched again next time
+    if parser.results:
+        cache.set(key, parser.results)
+    return parser.results
@@ -1,4 +1,14 @@
 import aiohttp
+import importlib.util
+import re
+import sys
+import time
+from collections import OrderedDict
+from metrics import timed
+
+description_limit = 2048  # the most characters Discord allows in an Embed description
+fence_mark = re.compile(r'```[^\s`]*')
+
 def fill(item:dict,**kwargs):
     """
 
@@ -7,6 +17,24 @@ def fill(item:dict,**kwargs):
     :return:
     """
 
+def lazy_import(name):
+    """
+    binds a module now but only runs its import on first attribute access
+    :param name: the module's full name, a missing module still raises ImportError straight away
+    :return: the module
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError("No module named {!r}".format(name), name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
 def partition(text: str, length: int)->list:
     """
     split a text according to its length
@@ -14,11 +42,54 @@ def partition(text: str, length: int)->list:
     :param length: maximum length of each substring
     :return: a list of substrings
     """
-    res=[]
-    while len(text)>0:
-        res.append(text[:length])
-        text=text[length:]
-    return res
+    return [text[i:i + length] for i in range(0, len(text), length)]
+
+
+def chunks(text: str, length: int = description_limit, fence: str = None, breaks=('\n', ' ')):
+    """
+    lazily splits text into pieces that fit in length, cutting at the first of breaks found in each piece
+    text is only searched and sliced by index, so splitting all of it takes linear time
+    :param text: input text
+    :param length: maximum length of each piece, counting any code fence added around it
+    :param fence: wraps every piece in a code block of this language, '' for a plain block. When None,
+        code blocks already in the text are closed at the end of a piece and reopened in the next one
+    :param breaks: separators to cut at in order of preference, trailing whitespace in them is dropped
+    :return: a generator of pieces
+    """
+    if fence is not None:
+        # a ``` in the text would close the wrapping block early
+        text = text.replace('```', '`\u200b``')
+        head, tail = '```{}\n'.format(fence), '\n```'
+    else:
+        head, tail = '', '\n```'
+    opened = None
+    start, n = 0, len(text)
+    while start < n:
+        prefix = head + (opened + '\n' if opened else '')
+        budget = length - len(prefix) - len(tail)
+        if budget <= 0:
+            raise ValueError("length {} leaves no room for text".format(length))
+        end = nxt = start + budget
+        if end >= n:
+            end = nxt = n
+        else:
+            for sep in breaks:
+                kept = len(sep.rstrip())
+                cut = text.rfind(sep, start + 1, min(n, end + len(sep) - kept))
+                if cut != -1:
+                    end, nxt = cut + kept, cut + len(sep)
+                    break
+        piece = text[start:end]
+        start = nxt
+        if fence is not None:
+            yield prefix + piece + tail
+            continue
+        marks = piece.count('```')
+        if marks % 2:
+            opened = None if opened else fence_mark.match(piece, piece.rfind('```')).group()
+        elif marks and opened:
+            opened = fence_mark.match(piece, piece.rfind('```')).group()
+        yield prefix + piece + (tail if opened else '')
 
 def tdm(td):
     """
@@ -51,7 +122,56 @@ async def getjson(url):
     :param url: the url used
     :return: the json output
     """
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as response:
-            f = await response.json(encoding='utf8')
+    with timed('http'):
+        async with aiohttp.ClientSession() as session:
+            async with session.get(url) as response:
+                f = await response.json(encoding='utf8')
     return f
+
+
+class LRUCache:
+    """
+    a small least-recently-used cache with an optional time to live
+    :param maxsize: maximum number of entries kept
+    :param ttl: seconds an entry stays valid, None for forever
+    """
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def get(self, key, default=None):
+        try:
+            stamp, value = self.data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if self.ttl is not None and time.monotonic() - stamp > self.ttl:
+            del self.data[key]
+            self.misses += 1
+            return default
+        self.data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self.data[key] = (time.monotonic(), value)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self.data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self.data.clear()
@@ -0,0 +1,78 @@
+import asyncio
+
+
+class ReactionSession:
+    '''
+    reactions on one message that a waiter is interested in
+    :param users: ids allowed to react, None for anyone
+    :param emojis: emojis that count, None for any
+    '''
+    __slots__ = ('message_id', 'users', 'emojis', 'queue')
+
+    def __init__(self, message_id, users=None, emojis=None):
+        self.message_id = message_id
+        self.users = None if users is None else set(users)
+        self.emojis = None if emojis is None else set(emojis)
+        self.queue = asyncio.Queue()
+
+    def accepts(self, emoji, user_id):
+        return ((self.users is None or user_id in self.users) and
+                (self.emojis is None or emoji in self.emojis))
+
+    async def wait(self, timeout=None):
+        """
+        waits for the next accepted reaction
+        :return: a (reaction, user) tuple
+        :raises asyncio.TimeoutError: when nothing arrives within timeout
+        """
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+
+class ReactionRouter:
+    '''
+    one reaction_add listener for every open session, found by message id
+    instead of discord.py checking every wait_for predicate on every reaction
+    '''
+
+    def __init__(self, bot_id=None):
+        self.bot_id = bot_id
+        self.sessions = {}
+        self.counters = {'events': 0, 'delivered': 0}
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def register(self, message_id, users=None, emojis=None):
+        session = self.sessions[message_id] = ReactionSession(message_id, users, emojis)
+        return session
+
+    def unregister(self, message_id):
+        self.sessions.pop(message_id, None)
+
+    def deliver(self, message_id, emoji, user_id, payload):
+        self.counters['events'] += 1
+        session = self.sessions.get(message_id)
+        if session is None or user_id == self.bot_id or not session.accepts(emoji, user_id):
+            return False
+        self.counters['delivered'] += 1
+        session.queue.put_nowait(payload)
+        return True
+
+    async def dispatch(self, reaction, user):
+        self.deliver(reaction.message.id, str(reaction), user.id, (reaction, user))
+
+    def stats(self):
+        return dict(self.counters, sessions=len(self.sessions))
+
+
+def get_reaction_router(bot) -> ReactionRouter:
+    """
+    gets the bot's reaction router, creating it and subscribing it to reaction_add on first use
+    """
+    router = getattr(bot, 'reaction_router', None)
+    if router is None:
+        router = bot.reaction_router = ReactionRouter()
+        bot.add_listener(router.dispatch, 'on_reaction_add')
+    if router.bot_id is None and bot.user is not None:
+        router.bot_id = bot.user.id
+    return router
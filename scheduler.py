@@ -0,0 +1,130 @@
+import asyncio
+import random
+import time
+
+
+class Job:
+    __slots__ = ('name', 'func', 'interval', 'jitter', 'next', 'task', 'runs', 'failures', 'missed', 'overlaps',
+                 'duration', 'last')
+
+    def __init__(self, name, func, interval, jitter):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.next = 0.0
+        self.task = None
+        self.runs = 0
+        self.failures = 0
+        self.missed = 0
+        self.overlaps = 0
+        self.duration = 0.0
+        self.last = None
+
+    @property
+    def running(self):
+        return self.task is not None and not self.task.done()
+
+    def stats(self):
+        return {'interval': self.interval, 'runs': self.runs, 'failures': self.failures, 'missed': self.missed,
+                'overlaps': self.overlaps, 'last ms': round(self.duration * 1000, 2),
+                'next in s': round(max(0.0, self.next - time.monotonic()), 1)}
+
+
+class Scheduler:
+    '''
+    runs the bot's periodic jobs from a single task, so reconnects can't start a second copy of any of them
+    each run is spread by jitter, a run still going when the next is due is skipped rather than doubled up,
+    and runs that could not happen on time are counted as missed
+    '''
+
+    def __init__(self, jitter=0.1):
+        self.jitter = jitter
+        self.jobs = {}
+        self.task = None
+        self.wakeup = None
+        self.on_error = None
+
+    def spread(self, job):
+        return job.interval * (1 + random.uniform(-job.jitter, job.jitter))
+
+    def add(self, name, func, interval, jitter=None, delay=None):
+        """
+        schedules a coroutine function every interval seconds, adding a name again only updates that job
+        :param name: the job's name, there is only ever one job per name
+        :param func: the coroutine function to run
+        :param interval: seconds between runs
+        :param jitter: fraction of interval each run may move by, the scheduler's default when None
+        :param delay: seconds until the first run, a jittered interval when None
+        :return: the Job
+        """
+        job = self.jobs.get(name)
+        if job is None:
+            job = self.jobs[name] = Job(name, func, interval, self.jitter if jitter is None else jitter)
+        else:
+            job.func, job.interval = func, interval
+        job.next = time.monotonic() + (self.spread(job) if delay is None else delay)
+        if self.wakeup is not None:
+            self.wakeup.set()
+        return job
+
+    def remove(self, name):
+        job = self.jobs.pop(name, None)
+        if job is not None and job.running:
+            job.task.cancel()
+
+    async def run(self, job):
+        start = time.monotonic()
+        try:
+            await job.func()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            job.failures += 1
+            if self.on_error is not None:
+                self.on_error(job=job.name, error="{}: {}".format(type(e).__name__, e))
+        finally:
+            job.runs += 1
+            job.duration = time.monotonic() - start
+            job.last = time.time()
+
+    async def driver(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            now = time.monotonic()
+            for job in list(self.jobs.values()):
+                if job.next > now:
+                    continue
+                late = now - job.next
+                if late >= job.interval:
+                    job.missed += int(late // job.interval)
+                if job.running:
+                    job.overlaps += 1
+                else:
+                    job.task = loop.create_task(self.run(job))
+                job.next = now + self.spread(job)
+            wait = min((job.next for job in self.jobs.values()), default=now + 60) - time.monotonic()
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(wait, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self, loop):
+        if self.task is None or self.task.done():
+            self.wakeup = asyncio.Event()
+            self.task = loop.create_task(self.driver())
+        return self.task
+
+    async def stop(self):
+        """
+        stops scheduling and waits for the jobs that are running to finish
+        """
+        if self.task is not None:
+            self.task.cancel()
+        running = [job.task for job in self.jobs.values() if job.running]
+        if running:
+            await asyncio.wait(running)
+
+    def stats(self):
+        return {name: job.stats() for name, job in self.jobs.items()}
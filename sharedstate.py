@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+import json
+import time
+from discord.ext import commands
+
+
+def parse_address(address):
+    """
+    :param address: host:port for TCP, anything else is a unix socket path
+    :return: (host, port) or the path
+    """
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def shared_cooldown(rate, per, type=commands.BucketType.default):
+    """
+    works like commands.cooldown, but the uses are counted across every cluster process through bot.shared
+    """
+    cooldown = commands.Cooldown(rate, per, type)
+
+    async def predicate(ctx):
+        bucket = {commands.BucketType.user: ctx.author.id, commands.BucketType.channel: ctx.channel.id,
+                  commands.BucketType.guild: ctx.guild.id if ctx.guild else ctx.author.id}.get(type, 'all')
+        retry_after = await ctx.bot.shared.hit('cooldown:{}:{}'.format(ctx.command.qualified_name, bucket), rate, per)
+        if retry_after:
+            raise commands.CommandOnCooldown(cooldown, retry_after)
+        return True
+    return commands.check(predicate)
+
+
+class Store:
+    '''
+    the shared values and cooldown windows, kept by the launcher for every cluster, or by a lone bot itself
+    '''
+
+    def __init__(self):
+        self.values = {}
+        self.windows = {}
+
+    def get(self, key):
+        entry = self.values.get(key)
+        if entry is None:
+            return None
+        value, expires = entry
+        if expires is not None and expires <= time.monotonic():
+            del self.values[key]
+            return None
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.values[key] = (value, None if ttl is None else time.monotonic() + ttl)
+
+    def delete(self, key):
+        self.values.pop(key, None)
+
+    def hit(self, key, rate, per):
+        """
+        counts a use of a cooldown bucket
+        :return: 0 when allowed, otherwise seconds until the bucket resets
+        """
+        now = time.monotonic()
+        count, start = self.windows.get(key, (0, now))
+        if now - start >= per:
+            count, start = 0, now
+        if count >= rate:
+            return start + per - now
+        self.windows[key] = (count + 1, start)
+        return 0.0
+
+    def handle(self, request):
+        op = request['op']
+        if op == 'get':
+            return self.get(request['key'])
+        if op == 'set':
+            return self.set(request['key'], request['value'], request.get('ttl'))
+        if op == 'delete':
+            return self.delete(request['key'])
+        if op == 'hit':
+            return self.hit(request['key'], request['rate'], request['per'])
+        raise ValueError("unknown op {!r}".format(op))
+
+
+class StateServer:
+    '''
+    serves a Store to the cluster processes over newline delimited JSON, and tells every other
+    client to drop its cached copy of a key when one of them sets or deletes it
+    '''
+
+    def __init__(self, address):
+        self.address = address
+        self.store = Store()
+        self.clients = set()
+        self.server = None
+        self.counters = {'requests': 0, 'invalidations': 0}
+
+    async def start(self):
+        address = parse_address(self.address)
+        if isinstance(address, tuple):
+            self.server = await asyncio.start_server(self.serve, *address)
+        else:
+            self.server = await asyncio.start_unix_server(self.serve, address)
+        return self.server
+
+    async def serve(self, reader, writer):
+        self.clients.add(writer)
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = json.loads(line)
+                self.counters['requests'] += 1
+                try:
+                    reply = {'id': request['id'], 'value': self.store.handle(request)}
+                except (KeyError, ValueError) as e:
+                    reply = {'id': request.get('id'), 'error': str(e)}
+                writer.write(json.dumps(reply).encode() + b'\n')
+                if request['op'] in ('set', 'delete'):
+                    self.invalidate(request['key'], writer)
+        except ConnectionError:
+            # a cluster died mid request, the launcher restarts it and it connects again
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+    def invalidate(self, key, sender):
+        message = json.dumps({'op': 'invalidate', 'key': key}).encode() + b'\n'
+        for client in self.clients:
+            if client is not sender:
+                client.write(message)
+                self.counters['invalidations'] += 1
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+
+
+class SharedState:
+    '''
+    state shared by all cluster processes through the launcher's StateServer, or kept in this process when there
+    is no launcher. Reads are cached locally until ttl runs out or another process changes the key.
+    While the server can't be reached, requests are answered by this process's own store instead
+    :param address: the StateServer's address, None to keep everything in this process
+    :param ttl: seconds a value read from the server stays cached here
+    :param timeout: seconds to wait for the server before falling back
+    :param retry: seconds to keep falling back after a failure before connecting again
+    '''
+
+    def __init__(self, address=None, ttl=300, timeout=2, retry=10):
+        self.address = address
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry = retry
+        self.local = Store()
+        self.cache = Store()
+        # bumped by every invalidation, so a read that raced one is not cached
+        self.generations = {}
+        self.ids = itertools.count()
+        self.waiting = {}
+        self.writer = None
+        self.retry_at = 0
+        self.lock = asyncio.Lock()
+        self.counters = {'hits': 0, 'misses': 0, 'loads': 0, 'invalidated': 0, 'fallbacks': 0}
+
+    async def connect(self):
+        async with self.lock:
+            if self.writer is not None:
+                return
+            address = parse_address(self.address)
+            if isinstance(address, tuple):
+                reader, self.writer = await asyncio.open_connection(*address)
+            else:
+                reader, self.writer = await asyncio.open_unix_connection(address)
+            asyncio.ensure_future(self.listen(reader))
+
+    def invalidate(self, key):
+        self.cache.delete(key)
+        self.generations[key] = self.generations.get(key, 0) + 1
+
+    async def listen(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get('op') == 'invalidate':
+                    self.invalidate(message['key'])
+                    self.counters['invalidated'] += 1
+                    continue
+                future = self.waiting.pop(message['id'], None)
+                if future is None or future.done():
+                    continue
+                if 'error' in message:
+                    future.set_exception(ValueError(message['error']))
+                else:
+                    future.set_result(message['value'])
+        finally:
+            self.writer = None
+            # the launcher went away: fail whoever is waiting, the next request reconnects
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("state server closed the connection"))
+            self.waiting.clear()
+            self.cache = Store()
+
+    async def request(self, op, **fields):
+        if self.address is None or time.monotonic() < self.retry_at:
+            return self.local.handle(dict(fields, op=op))
+        fields.update(op=op, id=next(self.ids))
+        try:
+            if self.writer is None:
+                await asyncio.wait_for(self.connect(), self.timeout)
+            future = asyncio.get_event_loop().create_future()
+            self.waiting[fields['id']] = future
+            self.writer.write(json.dumps(fields).encode() + b'\n')
+            return await asyncio.wait_for(future, self.timeout)
+        except (OSError, asyncio.TimeoutError):
+            # the launcher is down or stuck: carry on with this cluster's own state rather than failing every command
+            self.waiting.pop(fields['id'], None)
+            self.retry_at = time.monotonic() + self.retry
+            self.counters['fallbacks'] += 1
+            return self.local.handle(fields)
+
+    async def get(self, key, loader=None, ttl=None):
+        """
+        :param key: the key
+        :param loader: coroutine function producing the value when nobody has it yet, the result is shared
+        :param ttl: seconds the loaded value is kept, the default ttl when None
+        :return: the value, None if there is none and no loader
+        """
+        value = self.cache.get(key)
+        if value is not None:
+            self.counters['hits'] += 1
+            return value
+        self.counters['misses'] += 1
+        generation = self.generations.get(key, 0)
+        value = await self.request('get', key=key)
+        if value is None and loader is not None:
+            self.counters['loads'] += 1
+            value = await loader()
+            await self.set(key, value, ttl)
+        elif value is not None and self.generations.get(key, 0) == generation:
+            self.cache.set(key, value, self.ttl if ttl is None else ttl)
+        return value
+
+    async def set(self, key, value, ttl=None):
+        self.cache.set(key, value, self.ttl if ttl is None else ttl)
+        await self.request('set', key=key, value=value, ttl=self.ttl if ttl is None else ttl)
+
+    async def delete(self, key):
+        self.cache.delete(key)
+        await self.request('delete', key=key)
+
+    async def hit(self, key, rate, per):
+        return await self.request('hit', key=key, rate=rate, per=per)
+
+    def stats(self):
+        return dict(self.counters, shared=self.address is not None, cached=len(self.cache.values))
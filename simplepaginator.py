@@ -1,15 +1,33 @@
 import discord
 import asyncio
+import functools
+import sys
+from collections import OrderedDict
+from reactionrouter import get_reaction_router
 
-async def pager(entries, chunk: int):
-    for x in range(0, len(entries), chunk):
-        yield entries[x:x + chunk]
+def page(**kwargs):
+    """
+    creates a page factory, the Embed is only built when the page is first shown
+    :param kwargs: Embed arguments, plus footer and thumbnail urls
+    :return: a function building the page
+    """
+    footer = kwargs.pop('footer', None)
+    thumbnail = kwargs.pop('thumbnail', None)
+
+    def build():
+        embed = discord.Embed(**kwargs)
+        if footer:
+            embed.set_footer(text=footer)
+        if thumbnail:
+            embed.set_thumbnail(url=thumbnail)
+        return embed
+    return build
 
 class SimplePaginator:
 
     __slots__ = ('entries', 'extras', 'title', 'description', 'colour', 'footer', 'length', 'prepend', 'append',
                  'fmt', 'timeout', 'ordered', 'controls', 'controller', 'pages', 'current', 'previous', 'eof', 'base',
-                 'names')
+                 'names', 'more', 'source', 'window', 'factories', 'debounce')
 
     def __init__(self, **kwargs):
         self.entries = kwargs.get('entries', None)
@@ -26,9 +44,16 @@ class SimplePaginator:
         self.fmt = kwargs.get('fmt', '')
         self.timeout = kwargs.get('timeout', 90)
         self.ordered = kwargs.get('ordered', False)
+        self.more = kwargs.get('more', None)
+        self.source = kwargs.get('source', None)
+        if self.source is not None and not hasattr(self.source, '__anext__'):
+            self.source = iter(self.source)
+        self.window = kwargs.get('window', 5)
+        self.debounce = kwargs.get('debounce', 0.3)
 
         self.controller = None
-        self.pages = []
+        self.factories = []
+        self.pages = OrderedDict()
         self.names = []
         self.base = None
 
@@ -37,15 +62,21 @@ class SimplePaginator:
         self.eof = 0
 
         self.controls = {'⏮': 0.0, '◀': -1, '⏹': 'stop', '\u274c': 'delete',
-                         '▶': +1, '⏭': None }
+                         '▶': +1, '⏭': 'last'}
 
     async def indexer(self, ctx, ctrl):
         if str(ctrl) in 'stopdelete':
             ctx.bot.loop.create_task(self.stop_controller(self.base,int(ctrl=="stop")))
         elif isinstance(ctrl, int):
             self.current += ctrl
+            if self.current > self.eof and self.pending:
+                await self.extend()
             if self.current > self.eof or self.current < 0:
                 self.current -= ctrl
+        elif ctrl == 'last':
+            while self.pending and await self.extend():
+                pass
+            self.current = int(self.eof)
         else:
             self.current = int(ctrl)
 
@@ -53,51 +84,125 @@ class SimplePaginator:
         bot = ctx.bot
         author = ctx.author
 
-        self.base = await ctx.send(embed=self.pages[0])
-
-        if len(self.pages) == 1:
-            await self.base.add_reaction('⏹')
-            await self.base.add_reaction('\u274c')
+        try:
+            self.base = await ctx.send(embed=self.get_page(0))
+        except Exception:
+            # the session was added before the send, nothing else would remove it
+            paginators.remove(self)
+            raise
+        router = get_reaction_router(bot)
+        session = router.register(self.base.id, users=[author.id], emojis=self.controls.keys())
+        try:
+            await self.control_loop(ctx, session)
+        finally:
+            router.unregister(self.base.id)
+            paginators.remove(self)
 
+    async def control_loop(self, ctx, session):
+        if len(self.factories) == 1 and not self.pending:
+            controls = ('⏹', '\u274c')
         else:
-            for reaction in self.controls:
+            controls = tuple(self.controls)
+        # the session is already listening, so clicks on the first controls count while the rest are added
+        adder = ctx.bot.loop.create_task(self.add_controls(controls))
+
+        try:
+            while True:
                 try:
-                    await self.base.add_reaction(reaction)
-                except discord.HTTPException:
-                    return
-
-        def check(r, u):
-            if str(r) not in self.controls.keys():
-                return False
-            elif u.id == bot.user.id or r.message.id != self.base.id:
-                return False
-            elif u.id != author.id:
-                return False
-            return True
-
-        while True:
-            try:
-                react, user = await bot.wait_for('reaction_add', check=check, timeout=self.timeout)
-            except asyncio.TimeoutError:
-                return ctx.bot.loop.create_task(self.stop_controller(self.base))
+                    clicks = [await session.wait(self.timeout)]
+                except asyncio.TimeoutError:
+                    return ctx.bot.loop.create_task(self.stop_controller(self.base))
+
+                # let a burst of clicks settle, then send only the page it ends on
+                if self.debounce:
+                    await asyncio.sleep(self.debounce)
+                while not session.queue.empty():
+                    clicks.append(session.queue.get_nowait())
 
-            control = self.controls.get(str(react))
+                for react, user in clicks:
+                    control = self.controls.get(str(react))
+                    if control in ('stop', 'delete'):
+                        return await self.indexer(ctx, control)
+                    ctx.bot.loop.create_task(self.remove_click(react, user))
+                    await self.indexer(ctx, control)
 
+                if self.previous == self.current:
+                    continue
+
+                try:
+                    await self.base.edit(embed=self.get_page(self.current))
+                    self.previous = self.current
+                except (KeyError, IndexError):
+                    self.current = self.previous
+        finally:
+            adder.cancel()
+
+    async def add_controls(self, controls):
+        """
+        adds the control reactions in order, discord.py spaces them out to the reaction rate limit
+        """
+        for reaction in controls:
             try:
-                await self.base.remove_reaction(react, user)
+                await self.base.add_reaction(reaction)
             except discord.HTTPException:
-                pass
+                # without the controls nobody can navigate, end the session like before
+                if self.controller is not None:
+                    self.controller.cancel()
+                return
 
-            self.previous = self.current
-            await self.indexer(ctx, control)
+    async def remove_click(self, react, user):
+        try:
+            await self.base.remove_reaction(react, user)
+        except discord.HTTPException:
+            pass
+
+    @property
+    def pending(self):
+        return self.source is not None or self.more is not None
 
-            if self.previous == self.current:
-                continue
+    def get_page(self, index):
+        """
+        builds a page the first time it is shown, keeping only the last few built pages
+        :param index: the page number, starting at 0
+        :return: the page's Embed
+        """
+        page = self.pages.get(index)
+        if page is not None:
+            self.pages.move_to_end(index)
+            return page
+        item = self.factories[index]
+        page = item if isinstance(item, discord.Embed) else item()
+        self.pages[index] = page
+        while len(self.pages) > self.window:
+            self.pages.popitem(last=False)
+        return page
 
+    async def extend(self):
+        """
+        pulls the next page from the source iterator, or asks the more callback for the next pages
+        :return: False once there is nothing left to add
+        """
+        pages = None
+        if self.source is not None:
             try:
-                await self.base.edit(embed=self.pages[self.current])
-            except KeyError:
-                pass
+                if hasattr(self.source, '__anext__'):
+                    pages = [await self.source.__anext__()]
+                else:
+                    pages = [next(self.source)]
+            except (StopIteration, StopAsyncIteration):
+                self.source = None
+        if not pages and self.more is not None:
+            try:
+                pages = await self.more()
+            except Exception:
+                pages = None
+            if not pages:
+                self.more = None
+        if not pages:
+            return False
+        self.factories.extend(pages)
+        self.eof = float(len(self.factories) - 1)
+        return True
 
     async def stop_controller(self, message, status=1):
         if status==1:
@@ -116,27 +221,135 @@ class SimplePaginator:
         except Exception:
             pass
 
+    def end(self):
+        """
+        ends the session from outside, clearing its controls if it got as far as sending
+        """
+        if self.base is not None:
+            asyncio.ensure_future(self.stop_controller(self.base))
+        elif self.controller is not None:
+            self.controller.cancel()
+
+    @property
+    def size(self):
+        """approximate bytes held by the entries, page factories and built pages"""
+        seen = set()
+        return sum(approx_size(part, seen) for part in (self.entries, self.factories, self.pages))
+
     def formmater(self, chunk):
         return '\n'.join(f'{self.prepend}{self.fmt}{value}{self.fmt[::-1]}{self.append}' for value in chunk)
 
+    def entry_page(self, index, total):
+        chunk = self.entries[index * self.length:(index + 1) * self.length]
+        page = discord.Embed(title=f'{self.title} - {index + 1}/{total}', color=self.colour)
+        page.description = self.formmater(chunk)
+
+        if self.footer:
+            page.set_footer(text=self.footer)
+        return page
+
     async def paginate(self, ctx):
         if self.extras:
-            self.pages = [p for p in self.extras if isinstance(p, discord.Embed)]
+            self.factories = [p for p in self.extras if isinstance(p, discord.Embed) or callable(p)]
 
         if self.entries:
-            chunks = [c async for c in pager(self.entries, self.length)]
+            total = -(-len(self.entries) // self.length)
+            self.factories += [functools.partial(self.entry_page, index, total) for index in range(total)]
+
+        # pull a second page if there is one, so a lone page only gets the stop controls
+        while self.pending and len(self.factories) < 2 and await self.extend():
+            pass
+
+        if not self.factories:
+            self.factories=[discord.Embed(title="Nothing Paginated",description="There is probably a blank output.",colour=discord.Colour.blurple())]
+
+        self.eof = float(len(self.factories) - 1)
+        self.controller = ctx.bot.loop.create_task(self.reaction_controller(ctx))
+        paginators.add(self, ctx.author.id, getattr(ctx.guild, 'id', None))
+
+
+def approx_size(obj, seen, depth=6):
+    """
+    rough bytes held by obj, following containers, Embeds and the closures page() builds
+    bound methods are not followed, so a paginator's own entry_page partials don't count it twice
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if depth == 0 or isinstance(obj, (str, bytes, int, float)):
+        return size
+    if isinstance(obj, dict):
+        items = [*obj.keys(), *obj.values()]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+    elif isinstance(obj, discord.Embed):
+        items = [obj.to_dict()]
+    elif isinstance(obj, functools.partial):
+        items = obj.args
+    elif getattr(obj, '__closure__', None):
+        items = [cell.cell_contents for cell in obj.__closure__]
+    else:
+        items = ()
+    return size + sum(approx_size(item, seen, depth - 1) for item in items)
+
+
+class SessionManager:
+    '''
+    keeps track of every live paginator, ending the oldest ones first when
+    a user, a guild or the whole bot has more open than allowed
+    '''
+
+    def __init__(self, per_user=3, per_guild=20, total=400):
+        self.limits = {'user': per_user, 'guild': per_guild}
+        self.total = total
+        self.live = OrderedDict()
+        self.groups = {}
+        self.counters = {'started': 0, 'evicted': 0}
+
+    def __len__(self):
+        return len(self.live)
+
+    def add(self, paginator, user_id, guild_id=None):
+        keys = [('user', user_id)]
+        if guild_id is not None:
+            keys.append(('guild', guild_id))
+        self.live[paginator] = keys
+        self.counters['started'] += 1
+        for key in keys:
+            group = self.groups.setdefault(key, OrderedDict())
+            group[paginator] = None
+            while len(group) > self.limits[key[0]]:
+                self.evict(next(iter(group)))
+        while len(self.live) > self.total:
+            self.evict(next(iter(self.live)))
+
+    def remove(self, paginator):
+        for key in self.live.pop(paginator, ()):
+            group = self.groups[key]
+            group.pop(paginator, None)
+            if not group:
+                del self.groups[key]
+
+    def evict(self, paginator):
+        self.remove(paginator)
+        self.counters['evicted'] += 1
+        paginator.end()
 
-            for index, chunk in enumerate(chunks):
-                page = discord.Embed(title=f'{self.title} - {index + 1}/{len(chunks)}', color=self.colour)
-                page.description = self.formmater(chunk)
+    async def close(self):
+        """
+        ends every session, for shutdown
+        """
+        while self.live:
+            paginator = next(iter(self.live))
+            self.remove(paginator)
+            if paginator.base is not None:
+                await paginator.stop_controller(paginator.base)
+            elif paginator.controller is not None:
+                paginator.controller.cancel()
 
-                if self.footer:
-                    page.set_footer(text=self.footer)
-                self.pages.append(page)
+    def stats(self):
+        return dict(self.counters, sessions=len(self.live), bytes=sum(p.size for p in self.live))
 
-        if not self.pages:
-            self.pages=[discord.Embed(title="Nothing Paginated",description="There is probably a blank output.",colour=discord.Colour.blurple())]
 
-        self.eof = float(len(self.pages) - 1)
-        self.controls['⏭'] = self.eof
-        self.controller = ctx.bot.loop.create_task(self.reaction_controller(ctx))
\ No newline at end of file
+paginators = SessionManager()
\ No newline at end of file
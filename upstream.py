@@ -0,0 +1,193 @@
+import asyncio
+import functools
+import time
+import quantumutils as utils
+from metrics import timed
+
+
+class UpstreamUnavailable(Exception):
+    '''raised when an upstream is failing fast, out of quota or out of time'''
+
+    def __init__(self, name, reason):
+        super().__init__(f"{name} is currently unavailable ({reason}). Please try again later.")
+        self.name = name
+        self.reason = reason
+
+
+class TokenBucket:
+    '''
+    allows rate calls per second on average with bursts of up to burst calls
+    tokens may go negative, which reserves a slot in the future
+    '''
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+
+    def reserve(self, limit: float) -> float:
+        """
+        takes a token if one is available within limit seconds
+        :param limit: longest acceptable wait
+        :return: seconds to wait before calling, -1 if that would exceed limit
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        wait = (1 - self.tokens) / self.rate if self.tokens < 1 else 0.0
+        if wait > limit:
+            return -1
+        self.tokens -= 1
+        return wait
+
+
+class CircuitBreaker:
+    '''
+    opens after threshold consecutive failures and fails fast for reset seconds,
+    then lets a single trial call through to decide whether to close again
+    '''
+
+    def __init__(self, threshold=5, reset=30):
+        self.threshold = threshold
+        self.reset = reset
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+
+    @property
+    def state(self):
+        if self.opened is None:
+            return 'closed'
+        if self.trial or time.monotonic() - self.opened >= self.reset:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        state = self.state
+        if state == 'closed':
+            return True
+        if state == 'half-open' and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        if self.trial or self.failures >= self.threshold:
+            self.opened = time.monotonic()
+        self.trial = False
+
+
+class Upstream:
+    '''
+    policy wrapped around every call to one third party service: a token bucket,
+    a cap on calls in flight, a deadline and a circuit breaker, with the last good
+    result per key kept to answer with while the service is down
+    '''
+
+    def __init__(self, name, rate=5.0, burst=5, inflight=4, timeout=10.0, threshold=5, reset=30, cached=128):
+        self.name = name
+        self.timeout = timeout
+        self.inflight = inflight
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(threshold, reset)
+        self.semaphore = None
+        self.cache = utils.LRUCache(maxsize=cached)
+        self.counters = {'calls': 0, 'ok': 0, 'failed': 0, 'timeouts': 0, 'rejected': 0, 'fallbacks': 0}
+        self.active = 0
+        self.latency = 0.0
+
+    def stats(self):
+        return dict(self.counters, state=self.breaker.state, active=self.active,
+                    tokens=round(self.bucket.tokens, 2), latency=round(self.latency * 1000, 1))
+
+    def fallback(self, key, reason):
+        if key is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.counters['fallbacks'] += 1
+                return cached
+        raise UpstreamUnavailable(self.name, reason)
+
+    async def run(self, func, *args, key=None, **kwargs):
+        """
+        calls a coroutine function under this upstream's policy
+        :param func: the coroutine function doing the request
+        :param key: identifies the request for the fallback cache, None to never fall back
+        :return: what func returned, or the last good result for key while the upstream is failing
+        """
+        self.counters['calls'] += 1
+        if not self.breaker.allow():
+            self.counters['rejected'] += 1
+            return self.fallback(key, 'circuit open')
+        deadline = time.monotonic() + self.timeout
+        wait = self.bucket.reserve(self.timeout / 2)
+        if wait < 0:
+            self.breaker.trial = False
+            self.counters['rejected'] += 1
+            return self.fallback(key, 'rate limited')
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.inflight)
+        try:
+            if wait:
+                await asyncio.sleep(wait)
+            await asyncio.wait_for(self.semaphore.acquire(), deadline - time.monotonic())
+        except asyncio.TimeoutError:
+            self.breaker.trial = False
+            self.counters['rejected'] += 1
+            return self.fallback(key, 'too busy')
+        self.active += 1
+        start = time.monotonic()
+        try:
+            res = await asyncio.wait_for(func(*args, **kwargs), max(deadline - start, 0.1))
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            self.counters['timeouts'] += 1
+            self.breaker.failure()
+            return self.fallback(key, 'timed out')
+        except Exception:
+            self.counters['failed'] += 1
+            self.breaker.failure()
+            return self.fallback(key, 'error')
+        finally:
+            self.active -= 1
+            self.semaphore.release()
+        self.latency = self.latency * 0.8 + (time.monotonic() - start) * 0.2
+        self.breaker.success()
+        self.counters['ok'] += 1
+        if key is not None:
+            self.cache.set(key, res)
+        return res
+
+    async def run_blocking(self, func, *args, key=None, **kwargs):
+        """
+        like run, but for blocking functions which are moved to the default thread executor
+        """
+        async def call():
+            # coroutine functions time themselves, like utils.getjson, the blocking clients can't
+            with timed('http'):
+                return await asyncio.get_event_loop().run_in_executor(None, functools.partial(func, *args, **kwargs))
+        return await self.run(call, key=key)
+
+    async def getjson(self, url, key=None):
+        return await self.run(utils.getjson, url, key=key)
+
+
+upstreams = {
+    'tanvis': Upstream('api.tanvis.xyz', rate=2, burst=5, inflight=4, timeout=8),
+    'oxford': Upstream('Oxford Dictionaries', rate=1, burst=3, inflight=2, timeout=8),
+    'fixer': Upstream('fixer.io', rate=0.1, burst=1, inflight=1, timeout=15),
+    'translate': Upstream('Google Translate', rate=2, burst=5, inflight=3, timeout=10),
+    'tts': Upstream('Google Text-to-Speech', rate=1, burst=3, inflight=2, timeout=15, cached=0),
+}
+
+
+def stats():
+    return {name: upstream.stats() for name, upstream in upstreams.items()}
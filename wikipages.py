@@ -0,0 +1,125 @@
+import asyncio
+import html
+import re
+import urllib.parse
+import discord
+import quantumutils as utils
+from simplepaginator import page
+
+api_url = "https://en.wikipedia.org/w/api.php?"
+thumbnail = "https://images-ext-1.discordapp.net/external/CYCtSp1meQ0f_ZFd5y0T14UlI_xvqqLWPjUJ2gINt58/https/en.wikipedia.org/static/images/project-logos/enwiki.png"
+
+skipped = {'See also', 'References', 'External links', 'Notes', 'Further reading', 'Bibliography', 'Sources'}
+
+# markup of a section that is not prose: its own heading, tables, figures and footnote markers
+dropped = re.compile(r'<(h2|table|figure|style|script)\b.*?</\1>|<sup\b[^>]*class="[^"]*reference[^"]*".*?</sup>', re.S)
+breaks = re.compile(r'</(?:p|li|dd|dt|h[3-6])>|<br\s*/?>')
+tags = re.compile(r'<[^>]+>')
+
+cache = utils.LRUCache(maxsize=64, ttl=3600)
+
+
+def plaintext(markup: str):
+    """
+    reduces the HTML of a parsed section to its text, one line per paragraph, list item or sub heading
+    """
+    markup = breaks.sub('\n', dropped.sub('', markup))
+    return html.unescape(tags.sub('', markup))
+
+
+def paragraphs(text: str, length: int = 1000):
+    """
+    packs whole paragraphs into chunks, only splitting a paragraph that is longer than length
+    :param text: input text
+    :param length: maximum length of each chunk
+    :return: a list of chunks
+    """
+    text = '\n\n'.join(filter(None, (para.strip() for para in text.split('\n'))))
+    return list(utils.chunks(text, length, breaks=('\n\n', '. ', ' ')))
+
+
+class Article:
+    '''
+    a Wikipedia article that is fetched and paginated one section at a time
+    the intro and the table of contents are downloaded first, each later section only once someone pages to it
+    '''
+
+    def __init__(self, title, intro, sections=()):
+        self.title = title
+        self.intro = intro
+        # (index, name) of the top level sections, index is what the parse API takes as section
+        self.sections = [(index, name) for index, name in sections if name not in skipped]
+        self.skipped = [name for _, name in sections if name in skipped]
+        self.texts = {}
+        self.lock = asyncio.Lock()
+
+    @classmethod
+    async def fetch(cls, query):
+        """
+        gets the article for a search query, from the cache when possible
+        :param query: the title to look up, redirects are followed
+        :return: an Article, None if there is no such page
+        """
+        key = query.lower()
+        article = cache.get(key)
+        if article is not None:
+            return article
+        f, toc = await asyncio.gather(
+            utils.getjson(api_url + urllib.parse.urlencode(
+                {'action': 'query', 'format': 'json', 'prop': 'extracts', 'redirects': 1, 'explaintext': 1,
+                 'exintro': 1, 'titles': query})),
+            utils.getjson(api_url + urllib.parse.urlencode(
+                {'action': 'parse', 'format': 'json', 'prop': 'sections', 'redirects': 1, 'page': query})))
+        page = list(f['query']['pages'].values())[0]
+        if 'missing' in page or 'extract' not in page:
+            return None
+        # a top level section is fetched along with its subsections, so those get no pages of their own
+        sections = [(s['index'], html.unescape(tags.sub('', s['line'])))
+                    for s in toc.get('parse', {}).get('sections', []) if s['toclevel'] == 1 and s['index'].isdigit()]
+        article = cls(page['title'], page['extract'], sections)
+        cache.set(key, article)
+        return article
+
+    async def section(self, n):
+        """
+        :param n: position of the section, 1 being the first after the intro
+        :return: the section's text, downloaded the first time it is asked for
+        """
+        index, _ = self.sections[n - 1]
+        async with self.lock:
+            if index not in self.texts:
+                f = await utils.getjson(api_url + urllib.parse.urlencode(
+                    {'action': 'parse', 'format': 'json', 'prop': 'text', 'redirects': 1, 'page': self.title,
+                     'section': index, 'disableeditsection': 1, 'disabletoc': 1}))
+                self.texts[index] = plaintext(f.get('parse', {}).get('text', {}).get('*', ''))
+        return self.texts[index]
+
+    def footer(self, n):
+        footer = f"Section {n + 1} of {len(self.sections) + 1}"
+        if self.skipped:
+            footer += " | not shown: " + ", ".join(self.skipped)
+        return footer
+
+    def embeds(self, n, body):
+        title = self.title if n == 0 else f"{self.title} - {self.sections[n - 1][1]}"
+        return [page(title=title, description=text, colour=discord.Colour.lighter_grey(), thumbnail=thumbnail,
+                     footer=self.footer(n))
+                for text in paragraphs(body)]
+
+    def pager(self):
+        """
+        creates the callback handed to SimplePaginator as more
+        :return: the first pages and a coroutine function returning the next section's pages
+        """
+        state = {'section': 0}
+
+        async def more():
+            # sections that are only tables or figures have no text, and no pages
+            while state['section'] < len(self.sections):
+                state['section'] += 1
+                pages = self.embeds(state['section'], await self.section(state['section']))
+                if pages:
+                    return pages
+            return []
+
+        return self.embeds(0, self.intro), more
@@ -0,0 +1,126 @@
+import asyncio
+import json
+import os
+import random
+import aiohttp
+
+latest_url = "https://xkcd.com/info.0.json"
+comic_url = "https://xkcd.com/{}/info.0.json"
+fields = ('num', 'safe_title', 'transcript', 'img', 'day', 'month', 'year')
+
+
+class XkcdIndex:
+    '''
+    local store of xkcd comic metadata
+    learns the latest comic number and fills in the rest in the background,
+    numbered and random lookups are answered from here whenever possible
+    '''
+
+    def __init__(self, path="Extras/xkcd.json", concurrency=4, interval=3600):
+        self.path = path
+        self.concurrency = concurrency
+        self.interval = interval
+        self.comics = {}
+        self.latest = 0
+        self.saving = asyncio.Lock()
+        self.load()
+
+    def __len__(self):
+        return len(self.comics)
+
+    @property
+    def missing(self):
+        return [i for i in range(1, self.latest + 1) if i not in self.comics and i != 404]
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.loads(f.read())
+        except (OSError, ValueError):
+            return
+        self.comics = {int(k): v for k, v in data["comics"].items()}
+        self.latest = data["latest"]
+
+    def write(self, latest, comics):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(json.dumps({"latest": latest, "comics": comics}))
+        os.replace(tmp, self.path)
+
+    async def save(self):
+        """
+        writes the index from a worker thread, the full index takes tens of milliseconds to dump
+        """
+        # the copy is what gets written, fetches can keep adding comics meanwhile
+        comics = dict(self.comics)
+        async with self.saving:
+            await asyncio.get_event_loop().run_in_executor(None, self.write, self.latest, comics)
+
+    def store(self, f: dict):
+        comic = {k: f[k] for k in fields}
+        self.comics[comic['num']] = comic
+        self.latest = max(self.latest, comic['num'])
+        return comic
+
+    async def fetch(self, session, num=None):
+        """
+        downloads the metadata of one comic and adds it to the index
+        :param session: the aiohttp session used
+        :param num: the comic number, None for the latest one
+        :return: the comic metadata, None if it does not exist
+        """
+        async with session.get(latest_url if num is None else comic_url.format(num)) as response:
+            if response.status == 404:
+                return None
+            response.raise_for_status()
+            return self.store(await response.json(encoding='utf8'))
+
+    async def get(self, num: int):
+        """
+        gets a comic, only touching the network when it is not indexed yet
+        :param num: the comic number
+        :return: the comic metadata, None if it does not exist
+        """
+        if num in self.comics:
+            return self.comics[num]
+        if num < 1 or num == 404:
+            return None
+        async with aiohttp.ClientSession() as session:
+            return await self.fetch(session, num)
+
+    async def random(self):
+        """
+        :return: a random comic, the latest one while nothing is indexed yet, None if xkcd had no comic to give
+        """
+        if not self.latest:
+            async with aiohttp.ClientSession() as session:
+                return await self.fetch(session)
+        num = 404
+        while num == 404:
+            num = random.randint(1, self.latest)
+        # a number xkcd skipped falls back to the latest comic, which is always indexed by now
+        return await self.get(num) or self.comics.get(self.latest)
+
+    async def fill(self, session):
+        missing = self.missing
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(num):
+            async with semaphore:
+                try:
+                    await self.fetch(session, num)
+                except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                    pass
+
+        for i in range(0, len(missing), 100):
+            await asyncio.gather(*(worker(num) for num in missing[i:i + 100]))
+            await self.save()
+
+    async def update(self):
+        """
+        picks up the latest comic and downloads any that are missing
+        """
+        async with aiohttp.ClientSession() as session:
+            await self.fetch(session)
+            await self.fill(session)
+        await self.save()